@@ -0,0 +1,129 @@
+"""Peak memory and latency of summarizing user URLs, by page size.
+
+Serves generated pages from a local HTTP server and compares three ways of
+reading them:
+
+  full      requests.get(url).text, the whole page decoded in memory
+  capped    fetch_client.get(url).text, capped at FETCH_MAX_BYTES
+  streamed  fetch_client.stream into PageExtractor, stopping at the text budget
+
+Usage: python benchmarks/bench_html_extract.py [--sizes-kb 64 1024 4096 16384] [--repeat 5]
+"""
+import argparse
+import http.server
+import os
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'penpal-matching-service'))
+
+import requests
+
+from fetch_client import fetch_client
+from html_extract import PageExtractor
+
+PARAGRAPH = "<p>Hiking, chess and <b>very</b> strong coffee &amp; long letters to friends far away.</p>\n"
+SCRIPT = "<script>var config = {" + "'key': 'value', " * 200 + "};</script>\n"
+
+
+def build_page(size):
+    """An HTML page of roughly size bytes: up to 128 KB of scripts up front, then body text."""
+    head = ('<html><head><title>Bench page</title>'
+            '<meta property="og:title" content="Bench"><meta property="og:description" content="A page">'
+            '<style>body { color: #333; }</style>')
+    parts = [head]
+    total = len(head)
+    while total < min(size // 4, 128 * 1024):
+        parts.append(SCRIPT)
+        total += len(SCRIPT)
+    parts.append('</head><body>')
+    while total < size:
+        parts.append(PARAGRAPH)
+        total += len(PARAGRAPH)
+    parts.append('</body></html>')
+    return ''.join(parts).encode()
+
+
+def serve(pages):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            body = pages[int(self.path.strip('/'))]
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # The streamed reader hangs up once it has enough text
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    class Server(http.server.ThreadingHTTPServer):
+        def handle_error(self, request, client_address):
+            pass
+
+    server = Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def read_full(url):
+    return len(requests.get(url, timeout=30).text)
+
+
+def read_capped(url):
+    return len(fetch_client.get(url).text)
+
+
+def read_streamed(url):
+    extractor = PageExtractor()
+    fetch_client.stream(url, extractor.feed_bytes)
+    return len(extractor.document()['text'])
+
+
+READERS = {'full': read_full, 'capped': read_capped, 'streamed': read_streamed}
+
+
+def measure(reader, url, repeat):
+    reader(url)  # warm up connections
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        reader(url)
+        latencies.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    reader(url)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(latencies), peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes-kb', type=int, nargs='+', default=[64, 1024, 4096, 16384])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    pages = [build_page(size_kb * 1024) for size_kb in args.sizes_kb]
+    server = serve(pages)
+    base = f"http://127.0.0.1:{server.server_port}"
+    print(f"{'page':>10} {'reader':>9} {'latency ms':>11} {'peak KiB':>10}")
+    try:
+        for index, size_kb in enumerate(args.sizes_kb):
+            for name, reader in READERS.items():
+                latency_ms, peak_kib = measure(reader, f"{base}/{index}", args.repeat)
+                print(f"{size_kb:>7} KB {name:>9} {latency_ms:11.1f} {peak_kib:10.0f}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
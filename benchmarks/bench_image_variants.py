@@ -0,0 +1,112 @@
+"""Bytes and download time saved by WebP image variants, against a local S3 stand-in.
+
+Uploads generated photo-like PNGs to a moto server, runs the variant job
+(cold, then again with nothing to do, then after replacing one source),
+and compares what a browser would download for a few viewport widths with
+and without the srcset in the manifest.
+
+Usage: python benchmarks/bench_image_variants.py [--images 12] [--workers 4] [--mbps 20]
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'website-images-service'))
+
+import boto3
+from moto.server import ThreadedMotoServer
+from PIL import Image, ImageFilter
+
+BUCKET = 'bench-variant-assets'
+VIEWPORTS = (375, 768, 1440)
+
+
+def photo_png(seed, size=(1920, 1280)):
+    """A PNG with smooth gradients and fine noise, which compresses about as badly as a photo."""
+    gradient = Image.linear_gradient('L').resize(size).rotate(seed * 37 % 360)
+    noise = Image.effect_noise(size, 24 + seed % 16).filter(ImageFilter.GaussianBlur(1))
+    image = Image.merge('RGB', (gradient, noise, Image.blend(gradient, noise, 0.5)))
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def chosen_bytes(entry, sizes, viewport):
+    """Bytes a browser downloads for an image: the narrowest variant covering the viewport."""
+    widths = entry['widths']
+    if not widths:
+        return None
+    width = next((width for width in widths if width >= viewport), widths[-1])
+    return sizes[width]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=12)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--mbps', type=float, default=20, help="link speed used to turn bytes into download time")
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = ThreadedMotoServer(port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    os.environ.update(AWS_ENDPOINT_URL=f"http://{host}:{port}", AWS_ACCESS_KEY_ID='bench',
+                      AWS_SECRET_ACCESS_KEY='bench', AWS_DEFAULT_REGION='us-east-1', WEB_ASSET_BUCKET=BUCKET)
+    try:
+        s3 = boto3.client('s3')
+        s3.create_bucket(Bucket=BUCKET)
+        for i in range(args.images):
+            s3.put_object(Bucket=BUCKET, Key=f"images/photo-{i}.png", Body=photo_png(i))
+
+        import image_variants
+        import website_images
+
+        cold = image_variants.run(workers=args.workers)
+        print(f"cold run:    {cold['generated']} sources rendered in {cold['seconds']:.2f}s "
+              f"with {args.workers} processes")
+        warm = image_variants.run(workers=args.workers)
+        print(f"warm run:    {warm['skipped']} up to date, {warm['generated']} rendered in {warm['seconds']:.2f}s")
+        s3.put_object(Bucket=BUCKET, Key="images/photo-0.png", Body=photo_png(1000))
+        changed = image_variants.run(workers=args.workers, prune=True)
+        print(f"one changed: {changed['generated']} rendered, {changed['pruned']} stale variants pruned "
+              f"in {changed['seconds']:.2f}s")
+
+        website_images._manifest['listed_at'] = 0
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                started_at = time.perf_counter()
+                response = website_images.lambda_handler({'headers': {}}, None)
+                manifest_ms = (time.perf_counter() - started_at) * 1000
+            finally:
+                sys.stdout = stdout
+        images = json.loads(response['body'])['images']
+        print(f"manifest:    {len(images)} images with srcsets, built in {manifest_ms:.1f} ms")
+
+        sources = {obj['Key']: obj for obj in website_images.list_assets()}
+        variant_sizes = {}
+        for obj in website_images.list_objects(website_images.VARIANT_PREFIX):
+            directory, _, name = obj['Key'].rpartition('/')
+            variant_sizes.setdefault(f"{directory}/", {})[int(name[:-6])] = obj['Size']
+
+        total_source = sum(obj['Size'] for obj in sources.values())
+        seconds_per_byte = 8 / (args.mbps * 1e6)
+        print(f"\n{'viewport':>9} {'original':>12} {'variants':>12} {'saved':>7} {'download':>18}")
+        for viewport in VIEWPORTS:
+            total_variant = 0
+            for entry, obj in zip(images, sources.values()):
+                sizes = variant_sizes[website_images.variant_dir(obj['Key'], obj['ETag'])]
+                total_variant += chosen_bytes(entry, sizes, viewport) or obj['Size']
+            print(f"{viewport:>7}px {total_source:>12,} {total_variant:>12,} {1 - total_variant / total_source:>7.1%} "
+                  f"{total_source * seconds_per_byte:>7.2f}s -> {total_variant * seconds_per_byte:>5.2f}s")
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
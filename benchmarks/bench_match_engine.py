@@ -0,0 +1,54 @@
+"""Measure MatchEngine build time and top-k scoring latency by pool size.
+
+Usage: python benchmarks/bench_match_engine.py [--sizes 10000 100000 1000000] [--queries 200]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'penpal-matching-service'))
+
+from match_engine import MatchEngine
+
+HOBBIES = ["hiking", "chess", "painting", "surfing", "baking", "gaming", "reading", "running",
+           "knitting", "birding", "climbing", "cooking", "dancing", "fishing", "music", "photography"]
+COLORS = ["red", "blue", "green", "purple", "yellow", "orange", "black", "pink"]
+WORDS = "the only way to do great work is to love what you do stay hungry stay foolish".split()
+
+
+def random_profile(rng):
+    return {
+        'hobbies': ", ".join(rng.sample(HOBBIES, rng.randint(1, 4))),
+        'favorite_color': rng.choice(COLORS),
+        'favorite_quote': " ".join(rng.sample(WORDS, 6)),
+    }
+
+
+def run(sizes, queries):
+    rng = random.Random(42)
+    print(f"{'penpals':>10}{'build s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for size in sizes:
+        engine = MatchEngine()
+        start = time.perf_counter()
+        engine.sync({f"penpal-{i}": random_profile(rng) for i in range(size)})
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        for _ in range(queries):
+            profile = random_profile(rng)
+            start = time.perf_counter()
+            engine.top_k(profile, k=5)
+            latencies.append((time.perf_counter() - start) * 1000)
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(f"{size:>10}{build_seconds:>10.1f}{quantiles[49]:>10.2f}{quantiles[98]:>10.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+    run(args.sizes, args.queries)
@@ -0,0 +1,244 @@
+"""Measure stage-timer overhead on the instrumented endpoints, with tracing on.
+
+Serves POST /match/match_penpal (penpal-matching) and POST /users/login
+(user-management) in-process against a moto DynamoDB stand-in. ddtrace's
+Flask integration opens a root span for every request and sends traces to
+a local stand-in agent, so each timer also takes the span.set_metric path.
+For each endpoint it reports:
+
+- the timed stages per request and the cost of one timer under a root span,
+- the request latency and the share of it spent in timers,
+- as a cross-check, latency with observe() replaced by a no-op, in
+  ABBA blocks so drift affects both sides alike.
+
+Each service runs in its own subprocess, since both use the same module
+names. Latency is measured against moto, whose calls take roughly as long
+as DynamoDB calls from inside AWS.
+
+Usage: python benchmarks/bench_metrics_overhead.py [--requests 1000] [--calls 100000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+SERVICES = ('penpal-matching-service', 'user-management-service')
+BLOCK = 10
+WARMUP = 50
+
+
+class AgentHandler(BaseHTTPRequestHandler):
+    """Accepts trace payloads like a Datadog agent and discards them."""
+
+    def _accept(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        body = b'{"rate_by_service": {}}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_PUT = do_POST = _accept
+
+    def do_GET(self):
+        self._accept()
+
+    def log_message(self, *args):
+        pass
+
+
+def per_call_us(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def create_table(dynamodb, name, keys, indexes=()):
+    attributes = dict(keys)
+    for _, index_keys in indexes:
+        attributes.update(index_keys)
+
+    def key_schema(keys):
+        return [{'AttributeName': key, 'KeyType': 'HASH' if i == 0 else 'RANGE'} for i, (key, _) in enumerate(keys)]
+
+    extra = {}
+    if indexes:
+        extra['GlobalSecondaryIndexes'] = [
+            {'IndexName': index, 'KeySchema': key_schema(index_keys), 'Projection': {'ProjectionType': 'ALL'}}
+            for index, index_keys in indexes]
+    dynamodb.create_table(TableName=name, KeySchema=key_schema(keys), BillingMode='PAY_PER_REQUEST',
+                          AttributeDefinitions=[{'AttributeName': k, 'AttributeType': t} for k, t in attributes.items()],
+                          **extra)
+
+
+def penpal_matching(dynamodb, requests):
+    """Seed enough penpals for every request to claim one; return send."""
+    create_table(dynamodb, 'bench-users', [('user_id', 'S')])
+    create_table(dynamodb, 'bench-penpals', [('penpal_id', 'S')])
+    create_table(dynamodb, 'bench-matches', [('penpal_id', 'S'), ('match_id', 'S')],
+                 [('user_id-timestamp-index', [('user_id', 'S'), ('timestamp', 'N')])])
+    hobbies = ["hiking", "chess", "painting", "surfing", "baking", "gaming", "reading", "running"]
+    with dynamodb.Table('bench-penpals').batch_writer() as batch:
+        for i in range(2 * requests + WARMUP + 100):
+            batch.put_item(Item={'penpal_id': f"penpal-{i}", 'penpal_name': f"Penpal {i}", 'available': True,
+                                 'hobbies': f"{hobbies[i % 8]}, {hobbies[(i * 3 + 1) % 8]}",
+                                 'favorite_color': ["red", "blue", "green"][i % 3]})
+
+    import jwt
+    import main
+    from app import create_app
+    from penpal_pool import penpal_pool
+
+    client = create_app().test_client()
+    # Loaded once: a periodic refresh mid-run would land in one side of the A/B
+    penpal_pool.refresh()
+    tokens = [jwt.encode({'sub': f"bench-{i}@example.com", 'name': f"Bench {i}"}, main.SECRET_KEY, algorithm='HS256')
+              for i in range(50)]
+    counter = iter(range(10 ** 9))
+
+    def send():
+        i = next(counter)
+        response = client.post('/match/match_penpal', headers={'Authorization': f"Bearer {tokens[i % len(tokens)]}"},
+                               json={'hobbies': f"{hobbies[i % 8]}, {hobbies[(i + 3) % 8]}",
+                                     'favoriteColor': 'blue', 'favoriteQuote': 'stay curious'})
+        assert response.status_code == 200, response.status_code
+        # Closing the response finishes the request's root span
+        response.close()
+
+    return send
+
+
+def user_management(dynamodb, requests):
+    """Seed users with real password hashes; return send."""
+    from werkzeug.security import generate_password_hash
+
+    create_table(dynamodb, 'bench-users', [('user_id', 'S')])
+    password_hash = generate_password_hash('bench-password')
+    with dynamodb.Table('bench-users').batch_writer() as batch:
+        for i in range(50):
+            batch.put_item(Item={'user_id': f"bench-{i}@example.com", 'name': f"Bench {i}", 'password': password_hash})
+
+    from app import create_app
+
+    client = create_app().test_client()
+    counter = iter(range(10 ** 9))
+
+    def send():
+        i = next(counter)
+        response = client.post('/users/login', data={'email': f"bench-{i % 50}@example.com",
+                                                     'password': 'bench-password'})
+        assert response.status_code == 200, response.status_code
+        # Closing the response finishes the request's root span
+        response.close()
+
+    return send
+
+
+def run_service(service, requests, calls):
+    """Run in a subprocess whose working directory is the service."""
+    from ddtrace import patch
+
+    # Root span per request, as under ddtrace-run
+    patch(flask=True)
+    import boto3
+    from ddtrace import tracer
+    from moto import mock_aws
+
+    sys.path.insert(0, os.getcwd())
+    import metrics
+
+    with mock_aws():
+        dynamodb = boto3.resource('dynamodb')
+        setup = penpal_matching if service == 'penpal-matching-service' else user_management
+        send = setup(dynamodb, requests)
+        for _ in range(WARMUP):
+            send()
+
+        real_observe = metrics.observe
+        observed = []
+        metrics.observe = lambda stage, seconds: observed.append(stage) or real_observe(stage, seconds)
+        send()
+        metrics.observe = real_observe
+        stages = len(observed)
+
+        @metrics.timed("bench_noop")
+        def timed_noop():
+            return None
+
+        def noop():
+            return None
+
+        with tracer.trace("bench.request"):
+            timer_us = per_call_us(timed_noop, calls) - per_call_us(noop, calls)
+
+        # Timers on and off in ABBA blocks, so drift and table growth hit both sides alike
+        totals = {True: 0.0, False: 0.0}
+        for block in range(2 * requests // BLOCK):
+            enabled = block % 4 in (0, 3)
+            metrics.observe = real_observe if enabled else (lambda stage, seconds: None)
+            start = time.perf_counter()
+            for _ in range(BLOCK):
+                send()
+            totals[enabled] += time.perf_counter() - start
+        metrics.observe = real_observe
+
+    count = 2 * requests // BLOCK * BLOCK / 2
+    return {
+        'service': service,
+        'tracer_enabled': tracer.enabled,
+        'stages': stages,
+        'stage_names': sorted(set(observed)),
+        'timer_us': timer_us,
+        'request_us': totals[True] / count * 1e6,
+        'request_no_timers_us': totals[False] / count * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000, help="requests per side of the A/B, per endpoint")
+    parser.add_argument('--calls', type=int, default=100000, help="calls used to time a single timer")
+    parser.add_argument('--service', choices=SERVICES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.service:
+        print(json.dumps(run_service(args.service, args.requests, args.calls)))
+        return
+
+    agent = ThreadingHTTPServer(('127.0.0.1', 0), AgentHandler)
+    threading.Thread(target=agent.serve_forever, daemon=True).start()
+    env = dict(os.environ, DD_TRACE_ENABLED='true', DD_TRACE_AGENT_URL=f"http://127.0.0.1:{agent.server_port}",
+               DD_INSTRUMENTATION_TELEMETRY_ENABLED='false', DD_REMOTE_CONFIGURATION_ENABLED='false',
+               AWS_ACCESS_KEY_ID='bench', AWS_SECRET_ACCESS_KEY='bench', AWS_DEFAULT_REGION='us-east-1',
+               AWS_WARM_UP='false', APP_BACKGROUND_THREADS='false', LOG_LEVEL='WARNING', USER_TABLE='bench-users', PENPAL_TABLE='bench-penpals',
+               MATCHES_TABLE='bench-matches', USER_CACHE_ENABLED='false')
+    env.pop('AWS_ENDPOINT_URL', None)
+    endpoints = {'penpal-matching-service': 'POST /match/match_penpal', 'user-management-service': 'POST /users/login'}
+    print(f"{'endpoint':<26}{'stages':>7}{'us/timer':>10}{'us/request':>12}{'timers':>8}"
+          f"{'no timers':>11}{'A/B diff':>10}")
+    for service in SERVICES:
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), '--service', service,
+                                 '--requests', str(args.requests), '--calls', str(args.calls)],
+                                cwd=os.path.join(ROOT, service), env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(result.stderr[-2000:], file=sys.stderr)
+            sys.exit(f"{service} failed")
+        r = json.loads(result.stdout.strip().splitlines()[-1])
+        assert r['tracer_enabled'], "tracer was not enabled"
+        share = r['stages'] * r['timer_us'] / r['request_us'] * 100
+        ab = (r['request_us'] - r['request_no_timers_us']) / r['request_no_timers_us'] * 100
+        print(f"{endpoints[service]:<26}{r['stages']:>7}{r['timer_us']:>10.2f}{r['request_us']:>12.0f}"
+              f"{share:>7.2f}%{r['request_no_timers_us']:>11.0f}{ab:>9.2f}%")
+        print(f"{'':<26}stages: {', '.join(r['stage_names'])}")
+    agent.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Compare per-request rendering with the page cache, per page and content encoding.
+
+Serves the real templates through the penpal-matching blueprints with the
+Flask test client, so the numbers are handler cost without network time.
+For throughput under gunicorn, the same switch works with loadtest.py:
+
+    python benchmarks/loadtest.py penpal-matching-service /match/ \\
+        render=PAGE_CACHE_ENABLED=false cached=PAGE_CACHE_ENABLED=true
+
+Usage: python benchmarks/bench_page_cache.py [--requests 5000] [--users 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+SERVICE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'penpal-matching-service')
+sys.path.insert(0, SERVICE)
+
+import jwt
+from flask import Flask
+
+import auth
+import main
+from page_cache import page_cache
+
+ENCODINGS = {'identity': None, 'gzip': 'gzip, deflate', 'br': 'gzip, deflate, br'}
+
+
+def build_app():
+    app = Flask(__name__, template_folder=os.path.join(SERVICE, 'templates'))
+    app.secret_key = 'bench'
+    app.register_blueprint(auth.auth)
+    app.register_blueprint(main.main)
+    return app
+
+
+def timed_requests(client, path, header_sets, count, rounds=3):
+    """Return (best requests per second over the rounds, bytes of the last response)."""
+    for headers in header_sets:
+        client.get(path, headers=headers)  # warm up, filling the cache for every user
+    best = 0.0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for i in range(count):
+            response = client.get(path, headers=header_sets[i % len(header_sets)])
+        best = max(best, count / (time.perf_counter() - start))
+    return best, len(response.data)
+
+
+def run(count, users):
+    app = build_app()
+    page_cache.warm(app, ['index.html', 'login.html', 'signup.html'])
+    client = app.test_client()
+    tokens = [jwt.encode({"sub": f"bench-{i}@example.com", "name": f"Bench User {i}", "exp": int(time.time()) + 3600},
+                         main.SECRET_KEY, algorithm="HS256") for i in range(users)]
+    pages = [('/match/', [{}]), ('/match/login', [{}]), ('/match/signup', [{}]),
+             ('/match/match_penpal', [{'Authorization': f"Bearer {token}"} for token in tokens])]
+
+    print(f"{'page':<22}{'mode':<16}{'req/s':>10}{'bytes':>8}{'speedup':>9}")
+    for path, header_sets in pages:
+        page_cache.enabled = False
+        baseline, size = timed_requests(client, path, header_sets, count)
+        print(f"{path:<22}{'render':<16}{baseline:>10.0f}{size:>8}{1:>8.1f}x")
+
+        page_cache.enabled = True
+        for encoding, accept in ENCODINGS.items():
+            headers = [dict(h, **({'Accept-Encoding': accept} if accept else {})) for h in header_sets]
+            rps, size = timed_requests(client, path, headers, count)
+            print(f"{'':<22}{'cached ' + encoding:<16}{rps:>10.0f}{size:>8}{rps / baseline:>8.1f}x")
+
+        etag = client.get(path, headers=dict(header_sets[0], **{'Accept-Encoding': ENCODINGS['br']})).headers['ETag']
+        # Only the first user's ETag matches, so revalidate as that user
+        headers = [dict(header_sets[0], **{'Accept-Encoding': ENCODINGS['br'], 'If-None-Match': etag})]
+        rps, size = timed_requests(client, path, headers, count)
+        print(f"{'':<22}{'304':<16}{rps:>10.0f}{size:>8}{rps / baseline:>8.1f}x")
+    print(f"\npage cache: {page_cache.stats()}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=200, help="distinct names on the match form")
+    args = parser.parse_args()
+    run(args.requests, args.users)
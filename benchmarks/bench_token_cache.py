@@ -0,0 +1,64 @@
+"""Compare per-request jwt_required overhead with the token cache on and off.
+
+Usage: python benchmarks/bench_token_cache.py [--requests 20000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'penpal-matching-service'))
+
+import jwt
+from flask import Flask
+
+import main
+from token_cache import token_cache
+
+
+def build_app():
+    app = Flask(__name__)
+
+    @app.route('/plain')
+    def plain():
+        return "ok"
+
+    @app.route('/authed')
+    @main.jwt_required
+    def authed():
+        return "ok"
+
+    return app
+
+
+def timed_requests(client, path, headers, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        client.get(path, headers=headers)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def run(count):
+    app = build_app()
+    client = app.test_client()
+    token = jwt.encode({"sub": "bench@example.com", "name": "Bench", "exp": int(time.time()) + 3600},
+                       main.SECRET_KEY, algorithm="HS256")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    baseline_us = timed_requests(client, '/plain', headers, count)
+    results = {}
+    for enabled in (False, True):
+        token_cache.enabled = enabled
+        timed_requests(client, '/authed', headers, 100)  # warm up
+        results[enabled] = timed_requests(client, '/authed', headers, count) - baseline_us
+
+    print(f"baseline request:       {baseline_us:8.1f} us")
+    print(f"auth overhead, no cache: {results[False]:8.1f} us/request")
+    print(f"auth overhead, cached:   {results[True]:8.1f} us/request")
+    print(f"token cache: {token_cache.stats()}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=20000)
+    run(parser.parse_args().requests)
@@ -0,0 +1,387 @@
+"""Offline benchmark harness for the penpal services and Lambdas.
+
+Starts a moto server as the DynamoDB and S3 stand-in, a local HTTP server
+for user-supplied profile and photo URLs, and both Flask services under
+gunicorn. It then drives a weighted request mix and invokes both Lambda
+handlers in-process. Latency percentiles and requests per second per
+endpoint are printed and written to JSON, which can be compared against
+an earlier run:
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/harness.py --output bench_output.json
+    python benchmarks/harness.py --compare bench_output.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+import requests
+from moto.server import ThreadedMotoServer
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+TABLES = {
+    'USER_TABLE': ('bench-users', [('user_id', 'S')]),
+    'PENPAL_TABLE': ('bench-penpals', [('penpal_id', 'S')]),
+    'MATCHES_TABLE': ('bench-matches', [('penpal_id', 'S'), ('match_id', 'S')]),
+    'PENPAL_RESERVATION_TABLE': ('bench-reservations', [('customer_id', 'S')]),
+}
+# (index name, key schema) of the global secondary indexes each table needs
+INDEXES = {
+    'MATCHES_TABLE': [('user_id-timestamp-index', [('user_id', 'S'), ('timestamp', 'N')])],
+}
+ASSET_BUCKET = 'bench-web-assets'
+
+HOBBIES = ["hiking", "chess", "painting", "surfing", "baking", "gaming", "reading", "running"]
+COLORS = ["red", "blue", "green", "purple", "yellow"]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    if len(latencies) > 1:
+        quantiles = statistics.quantiles(latencies, n=100)
+        p50, p95, p99 = quantiles[49], quantiles[94], quantiles[98]
+    else:
+        p50 = p95 = p99 = latencies[0] if latencies else 0.0
+    return {
+        'count': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': p50 * 1000,
+        'p95_ms': p95 * 1000,
+        'p99_ms': p99 * 1000,
+    }
+
+
+class UserUrlHandler(BaseHTTPRequestHandler):
+    """Serves stand-in profile pages, profile JSON and photos."""
+
+    html = b"<html><head><title>Profile</title></head><body>" + b"<p>hello world</p>" * 20000 + b"</body></html>"
+    photo = b"\x89PNG\r\n\x1a\n" + b"\x00" * 200_000
+
+    def _body(self):
+        if self.path.startswith('/profile.json'):
+            return 'application/json', json.dumps({'hobbies': HOBBIES}).encode()
+        if self.path.startswith('/photo.png'):
+            return 'image/png', self.photo
+        return 'text/html', self.html
+
+    def _send(self, include_body):
+        content_type, body = self._body()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if include_body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._send(True)
+
+    def do_HEAD(self):
+        self._send(False)
+
+    def log_message(self, *args):
+        pass
+
+
+class Stack:
+    """The stand-in AWS endpoint, user URL server and both services."""
+
+    def __init__(self, args):
+        self.args = args
+        self.processes = []
+        self.moto = None
+        self.url_server = None
+
+    def start(self):
+        moto_port = free_port()
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        self.moto = ThreadedMotoServer(port=moto_port, verbose=False)
+        self.moto.start()
+        os.environ.update(
+            AWS_ENDPOINT_URL=f"http://127.0.0.1:{moto_port}",
+            AWS_ACCESS_KEY_ID='bench', AWS_SECRET_ACCESS_KEY='bench', AWS_DEFAULT_REGION='us-east-1',
+            WEB_ASSET_BUCKET=ASSET_BUCKET, DD_TRACE_ENABLED='false',
+            **{env: name for env, (name, _) in TABLES.items()})
+        self.seed()
+
+        url_port = free_port()
+        self.url_server = ThreadingHTTPServer(('127.0.0.1', url_port), UserUrlHandler)
+        threading.Thread(target=self.url_server.serve_forever, daemon=True).start()
+        self.url_base = f"http://127.0.0.1:{url_port}"
+
+        users_port = self.start_service('user-management-service')
+        self.users_base = f"http://127.0.0.1:{users_port}"
+        # Per-user admission limits would turn the URL checks into 429s; measure capacity instead
+        match_port = self.start_service(
+            'penpal-matching-service', USER_MANAGEMENT_URL=f"{self.users_base}/users",
+            ADMISSION_PATH=os.path.join(tempfile.mkdtemp(), 'admission'), ADMISSION_RATE='10000',
+            ADMISSION_BURST='10000')
+        self.match_base = f"http://127.0.0.1:{match_port}"
+
+    def seed(self):
+        dynamodb = boto3.resource('dynamodb')
+        def key_schema(keys):
+            return [{'AttributeName': key, 'KeyType': 'HASH' if i == 0 else 'RANGE'} for i, (key, _) in enumerate(keys)]
+
+        for env, (name, keys) in TABLES.items():
+            indexes = INDEXES.get(env, [])
+            attributes = dict(keys)
+            for _, index_keys in indexes:
+                attributes.update(index_keys)
+            extra = {}
+            if indexes:
+                extra['GlobalSecondaryIndexes'] = [
+                    {'IndexName': index, 'KeySchema': key_schema(index_keys), 'Projection': {'ProjectionType': 'ALL'}}
+                    for index, index_keys in indexes]
+            dynamodb.create_table(
+                TableName=name,
+                KeySchema=key_schema(keys),
+                AttributeDefinitions=[{'AttributeName': key, 'AttributeType': kind} for key, kind in attributes.items()],
+                BillingMode='PAY_PER_REQUEST', **extra)
+        rng = random.Random(1)
+        with dynamodb.Table(TABLES['PENPAL_TABLE'][0]).batch_writer() as batch:
+            for i in range(self.args.penpals):
+                batch.put_item(Item={
+                    'penpal_id': f"penpal-{i}",
+                    'penpal_name': f"Penpal {i}",
+                    'available': True,
+                    'hobbies': ", ".join(rng.sample(HOBBIES, 2)),
+                    'favorite_color': rng.choice(COLORS),
+                })
+
+        s3 = boto3.client('s3')
+        s3.create_bucket(Bucket=ASSET_BUCKET)
+        for i in range(self.args.assets):
+            s3.put_object(Bucket=ASSET_BUCKET, Key=f"images/asset-{i}.png", Body=UserUrlHandler.photo[:1024])
+
+    def start_service(self, directory, **env):
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', '--access-logfile', os.devnull, 'wsgi:app'],
+            cwd=os.path.join(ROOT, directory),
+            env=dict(os.environ, PORT=str(port), GUNICORN_WORKERS=str(self.args.workers), **env),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.processes.append(process)
+        wait_for_port(port)
+        return port
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+            process.wait()
+        if self.url_server:
+            self.url_server.shutdown()
+        if self.moto:
+            self.moto.stop()
+
+
+def signup_users(stack, count):
+    """Create users through penpal-matching and collect their tokens from user-management."""
+    tokens = []
+    session = requests.Session()
+    for i in range(count):
+        email, password = f"bench-{i}@example.com", "bench-password"
+        session.post(f"{stack.match_base}/match/signup", allow_redirects=False,
+                     data={'email': email, 'name': f"Bench {i}", 'password': password})
+        response = session.post(f"{stack.users_base}/users/login", data={'email': email, 'password': password})
+        tokens.append((email, password, response.json()['access_token']))
+    return tokens
+
+
+def request_mix(stack, tokens):
+    """(name, weight, function(session, rng)) for each endpoint in the mix."""
+
+    def authed(rng):
+        return {'Authorization': f"Bearer {rng.choice(tokens)[2]}"}
+
+    def match_profile(rng):
+        return {'hobbies': ", ".join(rng.sample(HOBBIES, 3)), 'favoriteColor': rng.choice(COLORS),
+                'favoriteQuote': "stay curious", 'profileUrl': f"{stack.url_base}/profile.json"}
+
+    def login(session, rng):
+        email, password, _ = rng.choice(tokens)
+        return session.post(f"{stack.match_base}/match/login", allow_redirects=False,
+                            data={'email': email, 'password': password})
+
+    return [
+        ('GET /match/', 20, lambda s, rng: s.get(f"{stack.match_base}/match/")),
+        ('GET /match/match_penpal', 20, lambda s, rng: s.get(f"{stack.match_base}/match/match_penpal", headers=authed(rng))),
+        ('POST /match/test_user_url', 15, lambda s, rng: s.post(
+            f"{stack.match_base}/match/test_user_url", headers=authed(rng),
+            json={'url': f"{stack.url_base}/profile.html?u={rng.randrange(50)}"})),
+        ('POST /match/test_photo_url', 15, lambda s, rng: s.post(
+            f"{stack.match_base}/match/test_photo_url", headers=authed(rng),
+            json={'url': f"{stack.url_base}/photo.png?u={rng.randrange(50)}"})),
+        ('POST /match/match_penpal', 10, lambda s, rng: s.post(
+            f"{stack.match_base}/match/match_penpal", headers=authed(rng), json=match_profile(rng))),
+        ('GET /match/history', 5, lambda s, rng: s.get(f"{stack.match_base}/match/history", headers=authed(rng))),
+        ('POST /match/login', 10, login),
+        ('GET /users/hello', 10, lambda s, rng: s.get(f"{stack.users_base}/users/hello")),
+    ]
+
+
+def drive(mix, duration, concurrency):
+    names = [name for name, _, _ in mix]
+    weights = [weight for _, weight, _ in mix]
+    calls = {name: call for name, _, call in mix}
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        local = {name: [] for name in names}
+        local_errors = {name: 0 for name in names}
+        while time.monotonic() < stop_at:
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                response = calls[name](session, rng)
+                ok = response.status_code < 500
+            except requests.RequestException:
+                ok = False
+            if ok:
+                local[name].append(time.perf_counter() - start)
+            else:
+                local_errors[name] += 1
+        with lock:
+            for name in names:
+                latencies[name].extend(local[name])
+                errors[name] += local_errors[name]
+
+    threads = [threading.Thread(target=client, args=(seed,)) for seed in range(concurrency)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    return {name: summarize(latencies[name], errors[name], elapsed) for name in names}
+
+
+def bench_lambdas(iterations):
+    sys.path.insert(0, os.path.join(ROOT, 'reservation-processing-service'))
+    sys.path.insert(0, os.path.join(ROOT, 'website-images-service'))
+    import reservation_processing
+    import website_images
+
+    def reservation(i):
+        return {'customer_id': f"customer-{i}", 'penpal_email': f"pal-{i}@example.com", 'penpal_type': 'Puppy',
+                'puppy_type': 'Corgi', 'puppy_secret_id': str(i)}
+
+    cases = {
+        'reservation single': lambda i: reservation_processing.lambda_handler({'detail': reservation(i)}, None),
+        'reservation SQS batch of 10': lambda i: reservation_processing.lambda_handler(
+            {'Records': [{'messageId': str(j), 'body': json.dumps(reservation(i * 10 + j))} for j in range(10)]}, None),
+        'website_images': lambda i: website_images.lambda_handler({'headers': {}}, None),
+    }
+    results = {}
+    for name, invoke in cases.items():
+        latencies, errors = [], 0
+        start = time.monotonic()
+        for i in range(iterations):
+            call_start = time.perf_counter()
+            # The handlers print every event; keep that out of the report
+            with contextlib.redirect_stdout(io.StringIO()):
+                response = invoke(i)
+            if response.get('statusCode', 200) >= 500 or response.get('batchItemFailures'):
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - call_start)
+        results[f"lambda {name}"] = summarize(latencies, errors, time.monotonic() - start)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    print(f"{'endpoint':<34}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+          + (f"{'p95 vs base':>13}" if baseline else ""))
+    for name, result in results.items():
+        line = (f"{name:<34}{result['rps']:>9.1f}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+                f"{result['p99_ms']:>9.2f}{result['errors']:>8}")
+        previous = (baseline or {}).get(name)
+        if previous and previous['p95_ms']:
+            line += f"{(result['p95_ms'] / previous['p95_ms'] - 1) * 100:>+12.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers per service")
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--penpals', type=int, default=5000)
+    parser.add_argument('--assets', type=int, default=50)
+    parser.add_argument('--lambda-iterations', type=int, default=200)
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--compare', help="JSON results from an earlier run to compare against")
+    args = parser.parse_args()
+
+    stack = Stack(args)
+    try:
+        stack.start()
+        tokens = signup_users(stack, args.users)
+        results = drive(request_mix(stack, tokens), args.duration, args.concurrency)
+        results.update(bench_lambdas(args.lambda_iterations))
+    finally:
+        stack.stop()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'commit': git_commit(),
+                'timestamp': int(time.time()),
+                'settings': vars(args),
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
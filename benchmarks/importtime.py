@@ -0,0 +1,165 @@
+"""Import-time budget and cold-start report for each entry point.
+
+For every entry point, runs a fresh interpreter with ``-X importtime`` and
+reports total import time and the heaviest top-level imports. With
+--cold-start it also starts a fresh interpreter per run that imports the
+entry point and makes its first call against a local moto server. That
+gives the init and first-invocation latency a cold Lambda or worker
+would see. Results can be saved and compared before/after a change:
+
+    python benchmarks/importtime.py --cold-start --output before.json
+    python benchmarks/importtime.py --cold-start --compare before.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+ENTRY_POINTS = {
+    'reservation_processing': ('reservation-processing-service', 'reservation_processing'),
+    'website_images': ('website-images-service', 'website_images'),
+    'penpal-matching': ('penpal-matching-service', 'auth, main'),
+    'user-management': ('user-management-service', 'auth, main'),
+}
+
+# First call made after import in --cold-start mode, per entry point
+FIRST_CALLS = {
+    'reservation_processing': "reservation_processing.lambda_handler({'detail': {'customer_id': 'c1', "
+                              "'penpal_email': 'p@example.com', 'penpal_type': 'Puppy', "
+                              "'puppy_type': 'Corgi', 'puppy_secret_id': '1'}}, None)",
+    'website_images': "website_images.lambda_handler({'headers': {}}, None)",
+}
+
+COLD_START_SCRIPT = """
+import contextlib, io, json, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    {first_call}
+done = time.perf_counter()
+print(json.dumps({{'init_ms': (imported - start) * 1000, 'first_call_ms': (done - imported) * 1000}}))
+"""
+
+BASE_ENV = {
+    'AWS_ACCESS_KEY_ID': 'bench', 'AWS_SECRET_ACCESS_KEY': 'bench', 'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_EC2_METADATA_DISABLED': 'true', 'AWS_WARM_UP': 'false', 'DD_TRACE_ENABLED': 'false',
+    'PENPAL_RESERVATION_TABLE': 'bench-reservations', 'WEB_ASSET_BUCKET': 'bench-web-assets',
+}
+
+
+def import_profile(directory, module, env):
+    """Return (total_ms, {top-level module: cumulative_ms}) from -X importtime."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        cwd=os.path.join(ROOT, directory), env=env, capture_output=True, text=True, check=True)
+    total_us = 0
+    top_level = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        total_us += int(self_us)
+        if not name[1:].startswith(' '):
+            # Unindented names are imported directly by the entry point
+            top_level[name.strip()] = int(cumulative_us) / 1000
+    return total_us / 1000, top_level
+
+
+def cold_start(directory, module, first_call, env, runs):
+    samples = []
+    for _ in range(runs):
+        script = COLD_START_SCRIPT.format(module=module, first_call=first_call)
+        result = subprocess.run([sys.executable, '-c', script], cwd=os.path.join(ROOT, directory),
+                                env=env, capture_output=True, text=True, check=True)
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {
+        'init_ms': statistics.median(sample['init_ms'] for sample in samples),
+        'first_call_ms': statistics.median(sample['first_call_ms'] for sample in samples),
+    }
+
+
+def start_stand_in():
+    """Start a moto server with the reservation table and asset bucket."""
+    import logging
+
+    import boto3
+    from moto.server import ThreadedMotoServer
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = ThreadedMotoServer(port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    endpoint = f"http://{host}:{port}"
+    session = boto3.session.Session(
+        aws_access_key_id='bench', aws_secret_access_key='bench', region_name='us-east-1')
+    session.client('dynamodb', endpoint_url=endpoint).create_table(
+        TableName=BASE_ENV['PENPAL_RESERVATION_TABLE'],
+        KeySchema=[{'AttributeName': 'customer_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'customer_id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST')
+    s3 = session.client('s3', endpoint_url=endpoint)
+    s3.create_bucket(Bucket=BASE_ENV['WEB_ASSET_BUCKET'])
+    s3.put_object(Bucket=BASE_ENV['WEB_ASSET_BUCKET'], Key='images/asset.png', Body=b'png')
+    return server, endpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument('--top', type=int, default=8, help="heaviest imports to list per entry point")
+    parser.add_argument('--cold-start', action='store_true', help="also measure init plus first invocation")
+    parser.add_argument('--output', help="write the report to this JSON file")
+    parser.add_argument('--compare', help="report from an earlier run to compare against")
+    args = parser.parse_args()
+
+    env = dict(os.environ, **BASE_ENV)
+    server = None
+    if args.cold_start:
+        server, env['AWS_ENDPOINT_URL'] = start_stand_in()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    report = {}
+    try:
+        for name, (directory, module) in ENTRY_POINTS.items():
+            totals, top_level = [], {}
+            for _ in range(args.runs):
+                total_ms, top_level = import_profile(directory, module, env)
+                totals.append(total_ms)
+            entry = {'import_ms': statistics.median(totals),
+                     'top_imports_ms': dict(sorted(top_level.items(), key=lambda kv: -kv[1])[:args.top])}
+            if args.cold_start and name in FIRST_CALLS:
+                entry.update(cold_start(directory, module, FIRST_CALLS[name], env, args.runs))
+            report[name] = entry
+    finally:
+        if server:
+            server.stop()
+
+    for name, entry in report.items():
+        before = baseline.get(name, {})
+        line = f"{name:<24} import {entry['import_ms']:8.1f} ms"
+        if before.get('import_ms'):
+            line += f" (was {before['import_ms']:.1f})"
+        if 'init_ms' in entry:
+            line += f"   cold init {entry['init_ms']:8.1f} ms   first call {entry['first_call_ms']:8.1f} ms"
+            if before.get('init_ms'):
+                line += f" (was {before['init_ms']:.1f} / {before['first_call_ms']:.1f})"
+        print(line)
+        for module, cumulative_ms in entry['top_imports_ms'].items():
+            print(f"    {module:<40}{cumulative_ms:8.1f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Compare throughput of a Flask service under different gunicorn configurations.
+
+Each configuration is started as its own gunicorn process from the
+service directory, driven with keep-alive HTTP clients for a fixed time,
+then stopped. Configurations are NAME=ENV,ENV,... where each ENV is a
+gunicorn.conf.py setting, for example:
+
+    python benchmarks/loadtest.py penpal-matching-service /match/hello \\
+        sync=GUNICORN_WORKER_CLASS=sync,GUNICORN_WORKERS=4 \\
+        gthread=GUNICORN_WORKER_CLASS=gthread,GUNICORN_WORKERS=4,GUNICORN_THREADS=8 \\
+        gevent=GUNICORN_WORKER_CLASS=gevent,GUNICORN_WORKERS=4
+"""
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def parse_config(spec):
+    name, _, settings = spec.partition('=')
+    env = dict(setting.split('=', 1) for setting in settings.split(',') if setting)
+    return name, env
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server did not start on port {port}")
+
+
+def drive(port, path, duration, concurrency):
+    """Send GET requests from concurrency keep-alive clients for duration seconds."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        local = []
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                conn.getresponse().read()
+                local.append(time.perf_counter() - start)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def run_config(service_dir, path, name, env, args):
+    port = args.port
+    server_env = dict(os.environ, PORT=str(port), AWS_WARM_UP='false', **env)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', '--access-logfile', os.devnull, 'wsgi:app'],
+        cwd=service_dir, env=server_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        drive(port, path, 1, args.concurrency)  # warm up
+        latencies, errors = drive(port, path, args.duration, args.concurrency)
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    count = len(latencies)
+    quantiles = statistics.quantiles(latencies, n=100) if count > 1 else [0] * 99
+    return {
+        'config': name,
+        'rps': count / args.duration,
+        'p50_ms': quantiles[49] * 1000,
+        'p99_ms': quantiles[98] * 1000,
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('service', help="service directory, e.g. penpal-matching-service")
+    parser.add_argument('path', help="request path, e.g. /match/hello")
+    parser.add_argument('configs', nargs='+', help="NAME=ENV=VALUE,ENV=VALUE,...")
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--port', type=int, default=8099)
+    args = parser.parse_args()
+
+    service_dir = os.path.join(ROOT, args.service)
+    print(f"{'config':<16}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for spec in args.configs:
+        name, env = parse_config(spec)
+        result = run_config(service_dir, args.path, name, env, args)
+        print(f"{result['config']:<16}{result['rps']:>10.1f}{result['p50_ms']:>10.2f}"
+              f"{result['p99_ms']:>10.2f}{result['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+import fcntl
+import hashlib
+import importlib
+import itertools
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from functools import wraps
+
+from flask import g, jsonify
+
+# Default per-user limit for each endpoint: tokens per second and bucket size
+ADMISSION_RATE = float(os.getenv('ADMISSION_RATE', '1'))
+ADMISSION_BURST = float(os.getenv('ADMISSION_BURST', '5'))
+# Per-endpoint overrides as rate/burst, e.g. "test_user_url=0.5/3,test_photo_url=2/10"
+ADMISSION_LIMITS = os.getenv('ADMISSION_LIMITS', '')
+# Outbound-fetch requests allowed at once across every worker on the host
+ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', '32'))
+# A concurrency slot held longer than this (e.g. by a killed worker) is reclaimed
+ADMISSION_LEASE_SECONDS = float(os.getenv('ADMISSION_LEASE_SECONDS', '30'))
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', '1'))
+ADMISSION_BUCKETS = int(os.getenv('ADMISSION_BUCKETS', '8192'))
+ADMISSION_PATH = os.getenv('ADMISSION_PATH') or os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'penpal-admission')
+# Backend class as module:Class, e.g. a shared store for limits across hosts
+ADMISSION_BACKEND = os.getenv('ADMISSION_BACKEND', 'admission:SharedMemoryBackend')
+
+MAGIC = b'PPADM002'
+# magic, bucket count, lease count, then the admitted, rejected by rate and
+# rejected by concurrency counters
+HEADER = struct.Struct('<8sIIqqq')
+COUNTERS_AT = 16
+ADMITTED, REJECTED_RATE, REJECTED_CONCURRENCY = range(3)
+# key hash, tokens, last update
+BUCKET = struct.Struct('<Qdd')
+# owner pid, owner's token for the request holding it, lease expiry
+LEASE = struct.Struct('<qqd')
+PROBES = 4
+
+
+def parse_limits(spec):
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, limit = entry.partition('=')
+        rate, _, burst = limit.partition('/')
+        limits[name.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+
+def check_limit(name, rate, burst):
+    # A zero rate would never refill, and a burst below one never admits anyone
+    if not rate > 0 or not burst >= 1:
+        raise ValueError(f"Invalid admission limit for {name}: rate must be positive and burst at least 1")
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedMemoryBackend:
+    """Token buckets and concurrency slots in a memory-mapped file.
+
+    Every worker on the host maps the same file, so they all enforce the
+    same limits. The file name includes the layout, so workers configured
+    differently use separate files. Updates hold an fcntl lock on the file (plus a thread lock,
+    since fcntl locks are per process). Buckets live in a fixed-size hash
+    table; when a key's slots are all taken, the least recently used bucket
+    is reused.
+
+    A backend provides take(key, rate, burst) -> (allowed, retry_after),
+    enter() -> lease or None, leave(lease) and stats().
+    """
+
+    def __init__(self, path=ADMISSION_PATH, buckets=ADMISSION_BUCKETS,
+                 max_concurrent=ADMISSION_MAX_CONCURRENT, lease_seconds=ADMISSION_LEASE_SECONDS):
+        self.path = f"{path}-{MAGIC[-3:].decode()}-{buckets}x{max_concurrent}"
+        self.buckets = buckets
+        self.max_concurrent = max_concurrent
+        self.lease_seconds = lease_seconds
+        self._buckets_at = HEADER.size
+        self._leases_at = self._buckets_at + buckets * BUCKET.size
+        self.size = self._leases_at + max_concurrent * LEASE.size
+        self._pid = None
+        self._fd = None
+        self._map = None
+        self._lock = None
+        self._open_lock = threading.Lock()
+        # Tells apart the leases held by concurrent requests in one worker
+        self._tokens = itertools.count(1)
+
+    def _open(self):
+        # fcntl locks are per process, so a forked worker opens the file itself
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._open_lock:
+                if self._pid != pid:
+                    self._map_file()
+                    self._pid = pid
+
+    def _map_file(self):
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+            try:
+                info = os.fstat(fd)
+                if info.st_nlink == 0:
+                    # Replaced by another worker while waiting for the lock
+                    ready = False
+                elif info.st_size == 0:
+                    # A new file, which nobody has mapped yet
+                    os.ftruncate(fd, self.size)
+                    os.pwrite(fd, self._header(), 0)
+                    ready = True
+                else:
+                    header = os.pread(fd, HEADER.size, 0)
+                    ready = (info.st_size == self.size
+                             and HEADER.unpack(header)[:3] == (MAGIC, self.buckets, self.max_concurrent))
+                    if not ready:
+                        # A damaged file: other workers may have it mapped, and
+                        # shrinking it under them would SIGBUS them, so swap in a new one
+                        self._replace()
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN)
+            if ready:
+                break
+            os.close(fd)
+        self._map = mmap.mmap(fd, self.size)
+        self._fd = fd
+        self._lock = threading.Lock()
+
+    def _header(self):
+        return HEADER.pack(MAGIC, self.buckets, self.max_concurrent, 0, 0, 0)
+
+    def _replace(self):
+        fd, path = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.', prefix='.penpal-admission-')
+        try:
+            os.ftruncate(fd, self.size)
+            os.pwrite(fd, self._header(), 0)
+            os.rename(path, self.path)
+        except BaseException:
+            os.unlink(path)
+            raise
+        finally:
+            os.close(fd)
+
+    def _locked(self):
+        self._open()
+        return _FileLock(self._lock, self._fd)
+
+    def _count(self, counter):
+        offset = COUNTERS_AT + 8 * counter
+        value, = struct.unpack_from('<q', self._map, offset)
+        struct.pack_into('<q', self._map, offset, value + 1)
+
+    def take(self, key, rate, burst):
+        """Take a token from key's bucket, returning (allowed, seconds until one is available)."""
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+        with self._locked():
+            # Wall-clock time, since the file can outlive a reboot
+            now = time.time()
+            slot, tokens = None, burst
+            oldest_at, oldest = None, math.inf
+            for probe in range(PROBES):
+                offset = self._buckets_at + ((key_hash + probe) % self.buckets) * BUCKET.size
+                stored_hash, stored_tokens, updated_at = BUCKET.unpack_from(self._map, offset)
+                if stored_hash == key_hash:
+                    slot = offset
+                    tokens = min(burst, stored_tokens + max(now - updated_at, 0.0) * rate)
+                    break
+                if stored_hash == 0 and slot is None:
+                    slot = offset
+                elif updated_at < oldest:
+                    oldest_at, oldest = offset, updated_at
+            if slot is None:
+                slot = oldest_at
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            BUCKET.pack_into(self._map, slot, key_hash, tokens, now)
+            if not allowed:
+                self._count(REJECTED_RATE)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def enter(self):
+        """Claim a host-wide concurrency slot, returning it, or None if all are taken."""
+        with self._locked():
+            now = time.time()
+            candidates = []
+            for index in range(self.max_concurrent):
+                offset = self._leases_at + index * LEASE.size
+                pid, _, expires_at = LEASE.unpack_from(self._map, offset)
+                if pid == 0 or expires_at < now:
+                    break
+                candidates.append((offset, pid))
+            else:
+                # Every slot is held; reclaim one whose worker has died
+                offset = next((offset for offset, pid in candidates if not _pid_alive(pid)), None)
+                if offset is None:
+                    self._count(REJECTED_CONCURRENCY)
+                    return None
+            lease = (offset, os.getpid(), next(self._tokens))
+            LEASE.pack_into(self._map, offset, lease[1], lease[2], now + self.lease_seconds)
+            self._count(ADMITTED)
+            return lease
+
+    def leave(self, lease):
+        offset, pid, token = lease
+        with self._locked():
+            # Skip slots reclaimed by another request after the lease expired
+            if LEASE.unpack_from(self._map, offset)[:2] == (pid, token):
+                LEASE.pack_into(self._map, offset, 0, 0, 0.0)
+
+    def stats(self):
+        with self._locked():
+            now = time.time()
+            admitted, rejected_rate, rejected_concurrency = HEADER.unpack_from(self._map, 0)[3:]
+            in_flight = sum(1 for index in range(self.max_concurrent)
+                            if LEASE.unpack_from(self._map, self._leases_at + index * LEASE.size)[2] >= now)
+        return {
+            'max_concurrent': self.max_concurrent,
+            'in_flight': in_flight,
+            'admitted': admitted,
+            'rejected_rate': rejected_rate,
+            'rejected_concurrency': rejected_concurrency,
+        }
+
+
+class _FileLock:
+    __slots__ = ('lock', 'fd')
+
+    def __init__(self, lock, fd):
+        self.lock = lock
+        self.fd = fd
+
+    def __enter__(self):
+        self.lock.acquire()
+        fcntl.lockf(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        self.lock.release()
+        return False
+
+
+def load_backend(spec=ADMISSION_BACKEND):
+    """Instantiate a backend given as module:Class."""
+    module_name, _, class_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+class AdmissionController:
+    """Per-user, per-endpoint rate limits plus a host-wide concurrency cap."""
+
+    def __init__(self, backend=None, limits=None):
+        self._backend = backend
+        self.limits = parse_limits(ADMISSION_LIMITS) if limits is None else limits
+        check_limit('the default', ADMISSION_RATE, ADMISSION_BURST)
+        for endpoint, (rate, burst) in self.limits.items():
+            check_limit(endpoint, rate, burst)
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = load_backend()
+        return self._backend
+
+    def limited(self, endpoint):
+        """Decorator for routes behind jwt_required that make outbound fetches."""
+        rate, burst = self.limits.get(endpoint, (ADMISSION_RATE, ADMISSION_BURST))
+
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                allowed, retry_after = self.backend.take(f"{endpoint}:{g.current_user['id']}", rate, burst)
+                if not allowed:
+                    return too_many_requests(retry_after)
+                lease = self.backend.enter()
+                if lease is None:
+                    return too_many_requests(ADMISSION_RETRY_AFTER)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.backend.leave(lease)
+
+            return wrapper
+
+        return decorator
+
+    def stats(self):
+        return self.backend.stats()
+
+
+def too_many_requests(retry_after):
+    response = jsonify({"error": "Too many requests, please try again shortly"})
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response, 429
+
+
+admission = AdmissionController()
@@ -1,10 +1,26 @@
 from flask import Flask
-import logging
+import os
+import secrets
 
 def create_app():
     app = Flask(__name__)
+    # Under gunicorn, background threads are started per worker in post_worker_init
+    start_threads = os.getenv('APP_BACKGROUND_THREADS', 'true').lower() == 'true'
 
-    logging.basicConfig(level=logging.INFO)  
+    # Queue-based, sampled logging with a background writer thread
+    import log_config
+    log_config.configure_logging(app, start=start_threads)
+
+    # Signs the session cookie that carries flashed messages; set it explicitly
+    # when workers are not forked from one preloaded app
+    app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY') or secrets.token_hex(32)
+    app.config['USER_TABLE'] = os.getenv('USER_TABLE')
+    app.config['PENPAL_TABLE'] = os.getenv('PENPAL_TABLE')
+    app.config['MATCHES_TABLE'] = os.getenv('MATCHES_TABLE')
+
+    # Shared, pre-warmed AWS clients for this worker
+    import aws_clients
+    aws_clients.init_app(app)
 
     # Blueprint for auth routes in the app
     from auth import auth as auth_blueprint
@@ -14,4 +30,13 @@ def create_app():
     from main import main as main_blueprint
     app.register_blueprint(main_blueprint)
 
+    # Render the pages that are the same for everyone before forking workers
+    from page_cache import page_cache
+    page_cache.warm(app, ['index.html', 'login.html', 'signup.html'])
+
+    # Load available penpals once and keep them fresh in the background
+    if start_threads:
+        from penpal_pool import penpal_pool
+        penpal_pool.start()
+
     return app
@@ -1,16 +1,19 @@
-from flask import Blueprint, render_template, request, redirect, url_for, make_response
-from werkzeug.security import generate_password_hash, check_password_hash
-import os
-import requests
-from ddtrace.appsec.trace_utils import track_user_login_success_event, track_user_login_failure_event, track_custom_event
-from ddtrace import tracer
+from flask import Blueprint, request, redirect, url_for, make_response, flash, current_app
+from page_cache import page_cache
+from user_management_client import UserManagementUnavailable, user_management_client
 
 auth = Blueprint('auth', __name__)
-USER_MANAGEMENT_URL = os.getenv('USER_MANAGEMENT_URL')
+
+@auth.errorhandler(UserManagementUnavailable)
+def user_management_unavailable(e):
+    """Send the user back to login with an error instead of waiting on a failing dependency."""
+    current_app.logger.warning("User management unavailable: %s", e)
+    flash("Login is temporarily unavailable, please try again in a moment")
+    return redirect(url_for('auth.login'))
 
 @auth.route('/match/login')
 def login():
-    return render_template('login.html')
+    return page_cache.render('login.html')
 
 @auth.route('/match/login', methods=['POST'])
 def login_post():
@@ -18,11 +21,7 @@ def login_post():
     password = request.form.get('password')
 
     # Forward the login request to the User Management Service
-    payload = {
-        "email": email,
-        "password": password
-    }
-    response = requests.post(f"{USER_MANAGEMENT_URL}/login", data=payload)
+    response = user_management_client.login(email, password)
 
     if response.status_code == 200:
         data = response.json()
@@ -42,7 +41,7 @@ def login_post():
 
 @auth.route('/match/signup')
 def signup():
-    return render_template('signup.html')
+    return page_cache.render('signup.html')
 
 @auth.route('/match/signup', methods=['POST'])
 def signup_post():
@@ -51,12 +50,7 @@ def signup_post():
     password = request.form.get('password')
 
     # Forward the signup request to the User Management Service
-    payload = {
-        "email": email,
-        "name": name,
-        "password": password
-    }
-    response = requests.post(f"{USER_MANAGEMENT_URL}/signup", data=payload)
+    response = user_management_client.signup(email, name, password)
 
     if response.status_code == 201:  # User created successfully
         return redirect(url_for('auth.login'))
@@ -76,7 +70,7 @@ def logout():
     token = request.headers.get("Authorization", "").replace("Bearer ", "")
 
     if token:
-        response = requests.post(f"{USER_MANAGEMENT_URL}/logout", headers={"Authorization": f"Bearer {token}"})
+        response = user_management_client.logout(token)
         if response.status_code == 200:
             return redirect(url_for('auth.login'))
         else:
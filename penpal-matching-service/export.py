@@ -0,0 +1,180 @@
+"""Export a DynamoDB table as NDJSON with a parallel segmented Scan.
+
+Each segment of the Scan runs in its own thread and follows
+LastEvaluatedKey until the segment is done. Pages pass through a bounded
+queue to a single writer, so memory stays flat however large the table is.
+Consumed read capacity is throttled to --max-rcu per second, and
+--projection limits the attributes read.
+
+    python export.py matches --output matches.ndjson
+    python export.py users --projection user_id,name --segments 4 --max-rcu 200
+
+The table is given as users, penpals or matches (read from USER_TABLE,
+PENPAL_TABLE and MATCHES_TABLE) or as a table name. Set AWS_ENDPOINT_URL
+to export from a local stand-in. The users table holds password hashes;
+use --projection to leave them out of exports that leave the account.
+Binary values are written as {"__bytes__": "<base64>"}.
+"""
+import argparse
+import base64
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from boto3.dynamodb.types import Binary, TypeDeserializer
+
+from aws_clients import get_client
+
+TABLES = {'users': 'USER_TABLE', 'penpals': 'PENPAL_TABLE', 'matches': 'MATCHES_TABLE'}
+
+
+class CapacityThrottle:
+    """Keep average consumed read capacity at or below a rate.
+
+    Consumed capacity is only known after a page is read, so each segment
+    pays for a page afterwards and sleeps while the shared budget is in debt.
+    """
+
+    def __init__(self, units_per_second):
+        self.rate = units_per_second
+        self._tokens = units_per_second
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.consumed = 0.0
+
+    def spend(self, units):
+        with self._lock:
+            self.consumed += units
+            if not self.rate:
+                return
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated_at) * self.rate) - units
+            self._updated_at = now
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+def projection_params(attributes):
+    """Build ProjectionExpression parameters, using placeholders so reserved words like name work."""
+    if not attributes:
+        return {}
+    names = {f"#p{index}": attribute for index, attribute in enumerate(attributes)}
+    return {'ProjectionExpression': ", ".join(names), 'ExpressionAttributeNames': names}
+
+
+def _put(pages, page, stop):
+    # Give up once the export is stopping, so no thread blocks on a full queue
+    while not stop.is_set():
+        try:
+            pages.put(page, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def scan_segment(table, segment, total_segments, pages, stop, throttle, page_size, projection):
+    """Scan one segment to the end, putting each page of items on the queue."""
+    client = get_client('dynamodb')
+    params = dict(TableName=table, Segment=segment, TotalSegments=total_segments,
+                  ReturnConsumedCapacity='TOTAL', **projection)
+    if page_size:
+        params['Limit'] = page_size
+    try:
+        while not stop.is_set():
+            response = client.scan(**params)
+            _put(pages, response['Items'], stop)
+            throttle.spend(response.get('ConsumedCapacity', {}).get('CapacityUnits', 0))
+            if 'LastEvaluatedKey' not in response:
+                return
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        _put(pages, None, stop)
+
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=lambda element: element.value if isinstance(element, Binary) else element)
+    if isinstance(value, Binary):
+        value = value.value
+    if isinstance(value, (bytes, bytearray)):
+        # Binary attributes stay lossless, and distinguishable from strings
+        return {'__bytes__': base64.b64encode(value).decode('ascii')}
+    return str(value)
+
+
+def export(table, output, segments=4, max_rcu=0, page_size=None, projection=None):
+    """Write every item of table to output as NDJSON, returning (items, consumed capacity)."""
+    deserializer = TypeDeserializer()
+    throttle = CapacityThrottle(max_rcu)
+    pages = queue.Queue(maxsize=segments * 2)
+    stop = threading.Event()
+    params = projection_params(projection)
+    items = 0
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        futures = [executor.submit(scan_segment, table, segment, segments, pages, stop, throttle, page_size, params)
+                   for segment in range(segments)]
+        remaining = segments
+        try:
+            while remaining:
+                try:
+                    page = pages.get(timeout=0.1)
+                except queue.Empty:
+                    if stop.is_set():
+                        break
+                    continue
+                if page is None:
+                    remaining -= 1
+                    continue
+                for item in page:
+                    record = {key: deserializer.deserialize(value) for key, value in item.items()}
+                    output.write(json.dumps(record, default=json_default) + "\n")
+                items += len(page)
+        except BaseException:
+            stop.set()
+            raise
+        for future in futures:
+            # Re-raise the first segment that failed
+            future.result()
+    return items, throttle.consumed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('table', help="users, penpals, matches or a table name")
+    parser.add_argument('--output', help="NDJSON file to write (default: stdout)")
+    parser.add_argument('--segments', type=int, default=4, help="parallel Scan segments")
+    parser.add_argument('--max-rcu', type=float, default=0, help="read capacity units per second, 0 for no limit")
+    parser.add_argument('--page-size', type=int, help="items per Scan call (default: up to 1 MB per page)")
+    parser.add_argument('--projection', help="comma-separated attributes to export (default: all)")
+    args = parser.parse_args()
+
+    table = os.getenv(TABLES[args.table]) if args.table in TABLES else args.table
+    if not table:
+        parser.error(f"{TABLES[args.table]} is not set")
+    projection = [attribute.strip() for attribute in args.projection.split(',')] if args.projection else None
+
+    started_at = time.monotonic()
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        items, consumed = export(table, output, args.segments, args.max_rcu, args.page_size, projection)
+    finally:
+        if args.output:
+            output.close()
+    elapsed = time.monotonic() - started_at
+    print(f"exported {items} items from {table} in {elapsed:.1f}s "
+          f"({items / elapsed if elapsed else 0:.0f} items/s, {consumed:.1f} RCUs consumed)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import timed
+
+FETCH_CONNECT_TIMEOUT = float(os.getenv('FETCH_CONNECT_TIMEOUT', '2'))
+FETCH_READ_TIMEOUT = float(os.getenv('FETCH_READ_TIMEOUT', '5'))
+FETCH_TOTAL_TIMEOUT = float(os.getenv('FETCH_TOTAL_TIMEOUT', '10'))
+FETCH_MAX_BYTES = int(os.getenv('FETCH_MAX_BYTES', str(1024 * 1024)))
+FETCH_MAX_CONCURRENT = int(os.getenv('FETCH_MAX_CONCURRENT', '16'))
+FETCH_QUEUE_TIMEOUT = float(os.getenv('FETCH_QUEUE_TIMEOUT', '1'))
+FETCH_MAX_HOSTS = int(os.getenv('FETCH_MAX_HOSTS', '256'))
+FETCH_POOL_SIZE = int(os.getenv('FETCH_POOL_SIZE', '4'))
+CHUNK_SIZE = 16 * 1024
+
+
+class FetchBusy(requests.RequestException):
+    """Too many outbound fetches are already in progress."""
+
+
+class FetchResult:
+    """Status, headers and the (possibly truncated) body of a fetch."""
+
+    def __init__(self, status_code, headers, content, encoding, truncated):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding
+        self.truncated = truncated
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class FetchClient:
+    """Bounded HTTP client for user-supplied URLs.
+
+    Keeps one pooled session per host (least recently used hosts are
+    closed), applies separate connect and read timeouts plus an overall
+    deadline, stops reading once max_bytes have arrived and limits how many
+    fetches may run at once in this process.
+    """
+
+    def __init__(self, connect_timeout=FETCH_CONNECT_TIMEOUT, read_timeout=FETCH_READ_TIMEOUT,
+                 total_timeout=FETCH_TOTAL_TIMEOUT, max_bytes=FETCH_MAX_BYTES,
+                 max_concurrent=FETCH_MAX_CONCURRENT, max_hosts=FETCH_MAX_HOSTS):
+        self.timeout = (connect_timeout, read_timeout)
+        self.total_timeout = total_timeout
+        self.max_bytes = max_bytes
+        self.max_hosts = max_hosts
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _session(self, url):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+                return session
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=FETCH_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._sessions[key] = session
+            if len(self._sessions) > self.max_hosts:
+                _, evicted = self._sessions.popitem(last=False)
+                evicted.close()
+            return session
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=FETCH_QUEUE_TIMEOUT):
+            raise FetchBusy("Too many outbound fetches in progress")
+
+    def _read(self, url, consume, max_bytes, headers):
+        """Stream a GET response body into consume(chunk, encoding).
+
+        Stops when consume returns False, max_bytes have arrived or the
+        overall deadline passes. Returns (response, truncated).
+        """
+        max_bytes = max_bytes or self.max_bytes
+        self._acquire()
+        try:
+            deadline = time.monotonic() + self.total_timeout
+            with self._session(url).get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                received = 0
+                truncated = False
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    chunk = chunk[:max_bytes - received]
+                    received += len(chunk)
+                    if consume(chunk, response.encoding) is False or received >= max_bytes:
+                        truncated = True
+                        break
+                    if time.monotonic() > deadline:
+                        raise requests.Timeout(f"Fetching {url} took longer than {self.total_timeout}s")
+                return response, truncated
+        finally:
+            self._slots.release()
+
+    @timed("outbound_http")
+    def get(self, url, max_bytes=None, headers=None):
+        """GET a URL, reading at most max_bytes of the body."""
+        chunks = []
+        response, truncated = self._read(url, lambda chunk, encoding: chunks.append(chunk), max_bytes, headers)
+        return FetchResult(response.status_code, response.headers, b''.join(chunks), response.encoding, truncated)
+
+    @timed("outbound_http")
+    def stream(self, url, consume, max_bytes=None, headers=None):
+        """GET a URL, passing body chunks to consume(chunk, encoding) as they arrive.
+
+        consume may return False to stop reading early. The returned result
+        has an empty body.
+        """
+        response, truncated = self._read(url, consume, max_bytes, headers)
+        return FetchResult(response.status_code, response.headers, b'', response.encoding, truncated)
+
+    @timed("outbound_http")
+    def probe(self, url):
+        """Return the status code for a URL without downloading its body.
+
+        Tries HEAD first and falls back to a one-byte ranged GET for servers
+        that do not support HEAD. A partial-content answer counts as 200.
+        """
+        self._acquire()
+        try:
+            session = self._session(url)
+            response = session.head(url, allow_redirects=True, timeout=self.timeout)
+            if response.status_code in (403, 405, 501):
+                with session.get(url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=self.timeout) as response:
+                    pass
+            return 200 if response.status_code == 206 else response.status_code
+        finally:
+            self._slots.release()
+
+
+fetch_client = FetchClient()
@@ -0,0 +1,116 @@
+import codecs
+import os
+from html.parser import HTMLParser
+
+# Visible text kept per page, in characters
+HTML_TEXT_BUDGET = int(os.getenv('HTML_TEXT_BUDGET_KB', '16')) * 1024
+MAX_TITLE_CHARS = 512
+MAX_META_TAGS = 32
+MAX_META_CHARS = 1024
+
+SKIPPED_TAGS = frozenset(('script', 'style', 'noscript', 'template', 'svg', 'iframe'))
+META_NAMES = frozenset(('description', 'keywords'))
+
+
+class PageExtractor(HTMLParser):
+    """Incrementally extract the title, og: metadata and visible text of a page.
+
+    Pass body chunks to feed_bytes as they arrive; it returns False once
+    the text budget is used up so the caller can stop reading the response.
+    Call close() after the last chunk.
+    """
+
+    def __init__(self, text_budget=HTML_TEXT_BUDGET):
+        super().__init__(convert_charrefs=True)
+        self.text_budget = text_budget
+        self.title = ''
+        self.meta = {}
+        self._text = []
+        self._text_len = 0
+        self._skip_depth = 0
+        self._in_title = False
+        self._space = False
+        self._decoder = None
+        self.bytes_read = 0
+
+    @property
+    def full(self):
+        return self._text_len >= self.text_budget
+
+    def feed_bytes(self, chunk, encoding=None):
+        """Decode and parse a chunk, returning False once enough text is collected."""
+        if self._decoder is None:
+            try:
+                self._decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+            except LookupError:
+                self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.bytes_read += len(chunk)
+        self.feed(self._decoder.decode(chunk))
+        return not self.full
+
+    def close(self):
+        """Flush text still buffered in the decoder and parser once the body has ended."""
+        if self._decoder is not None:
+            self.feed(self._decoder.decode(b'', final=True))
+        super().close()
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag == 'title':
+            self._in_title = True
+        elif tag == 'meta':
+            self._handle_meta(dict(attrs))
+        else:
+            # Tags separate words, e.g. <td>a</td><td>b</td>
+            self._space = True
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif tag == 'title':
+            self._in_title = False
+        else:
+            self._space = True
+
+    def handle_data(self, data):
+        if self._skip_depth or self.full:
+            return
+        if self._in_title:
+            self.title = (self.title + data)[:MAX_TITLE_CHARS]
+            return
+        words = data.split()
+        if not words:
+            self._space = self._space or bool(data)
+            return
+        # Text may arrive split mid-word across chunks, so only add a space
+        # where the page had whitespace or a tag
+        text = ' '.join(words)
+        if self._text and (self._space or data[0].isspace()):
+            text = ' ' + text
+        self._space = data[-1].isspace()
+        self._add_text(text)
+
+    def _handle_meta(self, attrs):
+        key = attrs.get('property') or attrs.get('name') or ''
+        content = attrs.get('content')
+        if content is None or len(self.meta) >= MAX_META_TAGS:
+            return
+        key = key.lower()
+        if key.startswith('og:') or key in META_NAMES:
+            self.meta.setdefault(key, content.strip()[:MAX_META_CHARS])
+
+    def _add_text(self, text):
+        text = text[:self.text_budget - self._text_len]
+        self._text.append(text)
+        self._text_len += len(text)
+
+    def document(self):
+        """Return the compact page document handed to the analyzer."""
+        return {
+            'title': ' '.join(self.title.split()),
+            'meta': self.meta,
+            'text': ''.join(self._text),
+            'truncated': self.full,
+            'bytes_read': self.bytes_read,
+        }
@@ -0,0 +1,157 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from flask.logging import default_handler
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_MAX_CHARS = int(os.getenv('LOG_MAX_CHARS', '2048'))
+# Per-logger sampling by module name, e.g. "main=0.1,urllib3=0.01"; records at WARNING and above are never sampled
+LOG_SAMPLE_RATES = os.getenv('LOG_SAMPLE_RATES', '')
+# Records per second allowed from each logger below WARNING, 0 for no limit
+LOG_RATE_LIMIT = float(os.getenv('LOG_RATE_LIMIT', '200'))
+
+LOG_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+
+_state = {'pid': None, 'queue': None, 'listener': None, 'handler': None, 'sampler': None}
+_lock = threading.Lock()
+
+
+def parse_sample_rates(spec):
+    rates = {}
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, rate = entry.partition('=')
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Sample and rate-limit low-severity records per logger."""
+
+    def __init__(self, sample_rates=None, rate_limit=LOG_RATE_LIMIT):
+        super().__init__()
+        self.sample_rates = sample_rates or {}
+        self.rate_limit = rate_limit
+        self._buckets = {}
+        self.dropped = 0
+
+    def _allow_rate(self, name):
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(name, (self.rate_limit, now))
+        tokens = min(self.rate_limit, tokens + (now - updated_at) * self.rate_limit)
+        if tokens < 1:
+            self._buckets[name] = (tokens, now)
+            return False
+        self._buckets[name] = (tokens - 1, now)
+        return True
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.sample_rates.get(record.name)
+        if rate is not None and random.random() >= rate:
+            self.dropped += 1
+            return False
+        if self.rate_limit and not self._allow_rate(record.name):
+            self.dropped += 1
+            return False
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records without formatting them and never block the caller.
+
+    Messages are formatted by the writer thread; when the queue is full the
+    record is dropped and counted instead.
+    """
+
+    dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class TruncatingFormatter(logging.Formatter):
+    """Cap the length of each formatted log line."""
+
+    def __init__(self, fmt=None, max_chars=LOG_MAX_CHARS):
+        super().__init__(fmt)
+        self.max_chars = max_chars
+
+    def format(self, record):
+        message = super().format(record)
+        if len(message) > self.max_chars:
+            message = f"{message[:self.max_chars]}... [truncated {len(message) - self.max_chars} chars]"
+        return message
+
+
+def _writer():
+    writer = logging.StreamHandler(sys.stderr)
+    writer.setFormatter(TruncatingFormatter(LOG_FORMAT))
+    return writer
+
+
+def start_listener():
+    """Switch this process to the queue and start its writer thread.
+
+    Safe to call repeatedly; a forked worker gets its own queue and thread,
+    so nothing its parent logged is written twice.
+    """
+    pid = os.getpid()
+    with _lock:
+        if _state['pid'] == pid:
+            return
+        records = queue.Queue(LOG_QUEUE_SIZE)
+        listener = logging.handlers.QueueListener(records, _writer(), respect_handler_level=False)
+        listener.start()
+        handler = DeferredQueueHandler(records)
+        handler.addFilter(_state['sampler'] or SamplingFilter(parse_sample_rates(LOG_SAMPLE_RATES)))
+        logging.getLogger().handlers = [handler]
+        _state.update(pid=pid, queue=records, listener=listener, handler=handler)
+    atexit.register(listener.stop)
+
+
+def configure_logging(app, start=True):
+    """Route all logging through the sampler, then a bounded queue drained by a writer thread.
+
+    Pass start=False in a process that forks workers, e.g. gunicorn's
+    master with preload: it writes straight to stderr, and each worker
+    switches to its own queue when it calls start_listener().
+    """
+    sampler = SamplingFilter(parse_sample_rates(LOG_SAMPLE_RATES))
+    writer = _writer()
+    writer.addFilter(sampler)
+
+    root = logging.getLogger()
+    root.handlers = [writer]
+    root.setLevel(LOG_LEVEL)
+    app.logger.removeHandler(default_handler)
+    _state['sampler'] = sampler
+    if _state['pid'] == os.getpid():
+        # This process already has its queue and writer; keep them with the new sampler
+        _state['handler'].filters = [sampler]
+        root.handlers = [_state['handler']]
+    elif start:
+        start_listener()
+
+
+def stats():
+    records, handler, sampler = _state['queue'], _state['handler'], _state['sampler']
+    return {
+        'queued': records.qsize() if records else 0,
+        'dropped_queue_full': handler.dropped if handler else 0,
+        'dropped_sampled': sampler.dropped if sampler else 0,
+    }
@@ -1,19 +1,45 @@
-from flask import Blueprint, render_template, request, jsonify, current_app, g, logging
-from flask.logging import default_handler
+from flask import Blueprint, Response, request, jsonify, current_app, g
 from functools import wraps
-import boto3
 import jwt
+import logging
 import os
 import time
 import random, uuid
-from boto3.dynamodb.conditions import Attr
 import requests
 from ddtrace.contrib.trace_utils import set_user
 from ddtrace.appsec.trace_utils import track_custom_event
 from ddtrace import tracer
+from penpal_pool import penpal_pool
+from aws_clients import get_client, get_table
+from boto3.dynamodb.types import TypeSerializer
+from admission import admission
+from fetch_client import FetchBusy, fetch_client
+from html_extract import PageExtractor
+from match_history import InvalidCursor, MATCH_HISTORY_PAGE_SIZE, match_history
+from page_cache import page_cache
+from url_cache import UrlCache
+from token_cache import token_cache
+from user_management_client import user_management_client
+import log_config
+from metrics import render_prometheus, timed
+from stages import Stage, StageTimeout, stage_scheduler
+
+logger = logging.getLogger(__name__)
 
 main = Blueprint('main', __name__)
 SECRET_KEY = "our-super-special-secret-key"  # Replace with secure storage (e.g., AWS Secrets Manager)
+MATCH_CLAIM_ATTEMPTS = int(os.getenv('MATCH_CLAIM_ATTEMPTS', '3'))
+
+_serializer = TypeSerializer()
+
+def serialize(values: dict):
+    """Convert Python values to DynamoDB attribute values for the low-level client."""
+    return {key: _serializer.serialize(value) for key, value in values.items()}
+
+# Cached probe and analysis results per URL; local overload is never cached
+url_summary_cache = UrlCache(should_cache_error=lambda e: not isinstance(e, FetchBusy))
+photo_probe_cache = UrlCache(should_cache_error=lambda e: not isinstance(e, FetchBusy))
+external_data_cache = UrlCache(should_cache_error=lambda e: not isinstance(e, FetchBusy))
 
 def jwt_required(func):
     """Decorator to validate JWT from headers, query parameters, or cookies."""
@@ -35,44 +61,49 @@ def jwt_required(func):
         if not token:
             return jsonify({"message": "Missing token"}), 401
         
-        logger = current_app.logger
-        logger.info(f"Validating JWT token: {token}")
-        
-        try:
-            # Decode the JWT
-            payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        # Reuse the prepared user if this token was already verified
+        g.current_user = token_cache.get(token)
+        if g.current_user is None:
+            logger.debug("Validating JWT token")
+            try:
+                # Decode the JWT
+                with timed("jwt_decode"):
+                    payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+            except jwt.ExpiredSignatureError:
+                return jsonify({"message": "Token expired"}), 401
+            except jwt.InvalidTokenError as e:
+                return jsonify({"message": f"Invalid token: {str(e)}"}), 401
+
             # Attach user info to the request context
             g.current_user = {
                 "id": payload.get("sub"),
                 "name": payload.get("name")
             }
-
-            # Add user information to the Datadog trace
-            set_user(
-                tracer,
-                user_id=g.current_user["id"],
-                name=g.current_user["name"],
-                email=g.current_user["id"],
-                propagate=True
-            )
-        except jwt.ExpiredSignatureError:
-            return jsonify({"message": "Token expired"}), 401
-        except jwt.InvalidTokenError as e:
-            return jsonify({"message": f"Invalid token: {str(e)}"}), 401
+            token_cache.put(token, payload, g.current_user)
+
+        # Add user information to the Datadog trace
+        set_user(
+            tracer,
+            user_id=g.current_user["id"],
+            name=g.current_user["name"],
+            email=g.current_user["id"],
+            propagate=True
+        )
 
         return func(*args, **kwargs)
 
     return wrapper
 
-def summarize_url_vibes(html_content):
+@timed("summarize_url_vibes")
+def summarize_url_vibes(page):
     """
-    Summarize the vibes of the HTML content using AI.
-    We do this by sending the content to an AI model and getting a summary.
+    Summarize the vibes of a page using AI.
+    We do this by sending the page title, metadata and visible text to an AI model and getting a summary.
     This helps the user test what sort of insights we will get from their URL before they submit the form.
     """
-    print(f"Summarizing vibes of HTML content: {html_content}")
+    logger.debug("Summarizing vibes of page content: %s", page)
 
-    # analyze_user_content_with_fancy_ai(html_content)  # Placeholder function for AI analysis
+    # analyze_user_content_with_fancy_ai(page)  # Placeholder function for AI analysis
     # in demo, we will just return a random response
     static_responses = [
         "This content seems very positive and uplifting!",
@@ -84,38 +115,8 @@ def summarize_url_vibes(html_content):
 
     return random.choice(static_responses)
 
-def save_penpal_match(user_id: str, penpal_id: str):
-    """Save new penpal match to dynamoDB."""
-    
-    match_table = os.getenv('MATCHES_TABLE')
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table(match_table)
-    logger = current_app.logger
-
-    logger.info("Writing penpal match DynamoDB") 
-    response = table.put_item(Item={
-        'penpal_id': penpal_id,
-        'match_id': str(uuid.uuid4()),
-        'user_id': user_id,
-        'timestamp': int(time.time())
-    })
-    logger.info(f"Saved match: {response}")
-
-    return 
-
-def save_user_details(user_response: dict):
-    """Save user details from match form to DynamoDB users table."""
-
-    user_table = os.getenv('USER_TABLE')
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table(user_table)
-
-    user_id = user_response.get("usr.id")
-    if not user_id:
-        raise ValueError("User ID is required")
-
-    logger = current_app.logger
-    logger.info("Writing user details to DynamoDB")
+def build_user_update(user_response: dict):
+    """Build the UpdateExpression and values for the user details from the match form."""
 
     # Build the update expression dynamically
     update_fields = []
@@ -146,78 +147,213 @@ def save_user_details(user_response: dict):
     # Join all update fields with commas
     update_expression = "SET " + ", ".join(update_fields)
 
+    return update_expression, expression_attribute_values
+
+@timed("save_user_details")
+def save_user_details(user_response: dict):
+    """Save user details from match form to DynamoDB users table."""
+
+    user_table = os.getenv('USER_TABLE')
+    table = get_table(user_table)
+
+    user_id = user_response.get("usr.id")
+    if not user_id:
+        raise ValueError("User ID is required")
+
+    logger.info("Writing user details to DynamoDB")
+
+    update_expression, expression_attribute_values = build_user_update(user_response)
+    update_kwargs = {}
+    if current_app.debug:
+        update_kwargs["ReturnValues"] = "UPDATED_NEW"  # Returns only the updated attributes
+
     try:
         response = table.update_item(
             Key={"user_id": user_id},
             UpdateExpression=update_expression,
             ExpressionAttributeValues=expression_attribute_values,
-            ReturnValues="UPDATED_NEW"  # Returns only the updated attributes
+            **update_kwargs
         )
-        logger.info(f"Successfully updated item in DynamoDB: {response['Attributes']}")
+        if current_app.debug:
+            logger.debug("Successfully updated item in DynamoDB: %s", response['Attributes'])
         return response
     except Exception as e:
-        logger.error(f"Error updating item in DynamoDB: {e}", exc_info=True)
+        logger.error("Error updating item in DynamoDB: %s", e, exc_info=True)
         raise
 
-def make_penpal_match(user_id: str):
-    """Fetch available penpals from the DynamoDB table and assign match."""
-    
-    logger = current_app.logger
-    logger.info("Getting penpals from DynamoDB") 
+@timed("save_penpal_match")
+def save_penpal_match(user_response: dict, penpal_id: str):
+    """Save user details, the match record and claim the penpal in one DynamoDB transaction.
 
-    penpals = {}
-    user_table = os.getenv('PENPAL_TABLE')
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table(user_table)
+    Returns False if the penpal was already claimed by another request.
+    """
 
-    response = table.scan(FilterExpression=Attr('available').eq(True))
-    for item in response['Items']:
-        penpals[item['penpal_id']] = {
-            'name': item['penpal_name']
-        }
+    user_id = user_response.get("usr.id")
+    if not user_id:
+        raise ValueError("User ID is required")
 
-    logger.info(f"Got penpals: {penpals}")
+    logger.info("Writing user details and penpal match to DynamoDB")
 
-    # do fancy logic to match user to their perfect penpal
-    matched_penpal_id = random.choice(list(penpals.keys())) if penpals else None
-    if matched_penpal_id:
-        save_penpal_match(user_id, matched_penpal_id)
+    update_expression, expression_attribute_values = build_user_update(user_response)
+    on_condition_failure = "ALL_OLD" if current_app.debug else "NONE"
+    client = get_client('dynamodb')
+    try:
+        client.transact_write_items(TransactItems=[
+            {'Update': {
+                'TableName': os.getenv('USER_TABLE'),
+                'Key': serialize({'user_id': user_id}),
+                'UpdateExpression': update_expression,
+                'ExpressionAttributeValues': serialize(expression_attribute_values),
+            }},
+            {'Put': {
+                'TableName': os.getenv('MATCHES_TABLE'),
+                'Item': serialize({
+                    'penpal_id': penpal_id,
+                    'match_id': str(uuid.uuid4()),
+                    'user_id': user_id,
+                    'timestamp': int(time.time())
+                }),
+            }},
+            # Only one request may claim a penpal
+            {'Update': {
+                'TableName': os.getenv('PENPAL_TABLE'),
+                'Key': serialize({'penpal_id': penpal_id}),
+                'UpdateExpression': "SET available = :unavailable",
+                'ConditionExpression': "available = :available",
+                'ExpressionAttributeValues': serialize({':available': True, ':unavailable': False}),
+                'ReturnValuesOnConditionCheckFailure': on_condition_failure,
+            }},
+        ])
+    except client.exceptions.TransactionCanceledException as e:
+        reasons = e.response.get('CancellationReasons', [])
+        # A concurrent claim shows up as a failed condition, or as a conflict
+        # when both transactions reach the penpal item at the same moment
+        if len(reasons) == 3 and reasons[2].get('Code') in ('ConditionalCheckFailed', 'TransactionConflict'):
+            logger.info("Penpal %s was already claimed (%s)", penpal_id, reasons[2].get('Code'))
+            return False
+        raise
 
-    return penpals[matched_penpal_id] if matched_penpal_id else None
+    return True
 
+@timed("make_penpal_match")
+def make_penpal_match(user_id: str, user_details: dict):
+    """Pick the most compatible available penpal from the in-process pool and assign match."""
+    
+    # Penpals this user was recently matched with are not offered again
+    past_penpal_ids = match_history.recent_penpals(user_id)
+
+    for _ in range(MATCH_CLAIM_ATTEMPTS):
+        # Score the user's hobbies, color and quote against every available penpal
+        choice = penpal_pool.match(user_details, exclude=past_penpal_ids)
+        if not choice:
+            break
+
+        matched_penpal_id, matched_penpal = choice
+        claimed = save_penpal_match(user_details, matched_penpal_id)
+        # Either way the penpal is no longer available
+        penpal_pool.remove(matched_penpal_id)
+        if claimed:
+            match_history.record(user_id, matched_penpal_id)
+            return matched_penpal
+
+    logger.info("No available penpals in pool")
+    save_user_details(user_details)
+    return None
+
+def fetch_external_data(url: str):
+    """Fetch external JSON data from a given URL."""
+    response = fetch_client.get(url)
+    if response.status_code == 200:
+        return response.json()
+    return None
+
+@timed("analyze_external_data")
 def analyze_external_data(url: str):
     """Fetch and analyze external data from a given URL."""
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.json()
-    except requests.RequestException as e:
-        print(f"Error fetching external data: {e}")
+        return external_data_cache.get_or_load(url, lambda: fetch_external_data(url), failed=lambda data: data is None)
+    except (requests.RequestException, ValueError) as e:
+        logger.warning("Error fetching external data: %s", e)
     return None
 
+def summarize_user_url(url: str):
+    """Fetch a user URL and summarize it, returning (status_code, summary).
+
+    The page is parsed as it streams in and reading stops once enough
+    visible text has been collected.
+    """
+    extractor = PageExtractor()
+    response = fetch_client.stream(url, extractor.feed_bytes)
+    if response.status_code != 200:
+        return response.status_code, None
+    extractor.close()
+    return 200, summarize_url_vibes(extractor.document()) # get AI summary of the page content
+
 def upload_photo(url: str):
     """Placeholder function for uploading a photo."""
-    print(f"Uploading photo from URL: {url}")
+    logger.info("Uploading photo from URL: %s", url)
     return
 
 @main.route('/match/hello', methods=['GET'])
 def hello():
     return "Hello, World!"
 
+def collect_stats():
+    """Gather in-process cache and client statistics."""
+    return {
+        "penpal_pool": penpal_pool.stats(),
+        "token_cache": token_cache.stats(),
+        "logging": log_config.stats(),
+        "url_summary_cache": url_summary_cache.stats(),
+        "photo_probe_cache": photo_probe_cache.stats(),
+        "external_data_cache": external_data_cache.stats(),
+        "user_management_client": user_management_client.stats(),
+        "admission": admission.stats(),
+        "match_history": match_history.stats(),
+        "page_cache": page_cache.stats(),
+    }
+
+@main.route('/match/stats', methods=['GET'])
+def stats():
+    """Expose in-process cache statistics."""
+    return jsonify(collect_stats())
+
+@main.route('/match/metrics', methods=['GET'])
+def metrics():
+    """Expose stage timings and cache statistics in Prometheus text format."""
+    return Response(render_prometheus("penpal_matching", collect_stats()), mimetype="text/plain; version=0.0.4")
+
 @main.route('/match/', methods=['GET'])
 def index():
     """Render matching home page."""
-    return render_template('index.html')
+    return page_cache.render('index.html')
 
 @main.route('/match/match_penpal', methods=['GET'])
 @jwt_required
 def match_penpal():
     """Render penpal match form - auth required."""
     user = g.current_user  # Access the user from the request context
-    return render_template('match_form.html', name=user["name"])
+    return page_cache.render('match_form.html', private=True, name=user["name"])
+
+@main.route('/match/history', methods=['GET'])
+@jwt_required
+def match_history_page():
+    """Return one page of the user's matches, newest first.
+
+    Pass the returned next_cursor as cursor to get the following page.
+    """
+    user = g.current_user
+    limit = request.args.get('limit', MATCH_HISTORY_PAGE_SIZE, type=int)
+    try:
+        with timed("dynamodb_match_history"):
+            matches, next_cursor = match_history.page(user["id"], limit, request.args.get('cursor'))
+    except InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"matches": matches, "next_cursor": next_cursor})
 
 @main.route('/match/test_user_url', methods=['POST'])
 @jwt_required
+@admission.limited("test_user_url")
 def test_user_url():
     '''
     Test the user provided URL by sending a GET request to it 
@@ -226,65 +362,66 @@ def test_user_url():
     '''
     user = g.current_user  # Access the user from the request context
     user_url = request.json.get('url')
-    print(f"Testing user URL: {user_url}")
+    logger.info("Testing user URL: %s", user_url)
     try:
-        response = requests.get(user_url)
-        if response.status_code == 200:
-            html_content = response.text  # Get the HTML content as a string
-            summarized_insights = summarize_url_vibes(html_content) # get AI summary of returned content
+        status_code, summarized_insights = url_summary_cache.get_or_load(
+            user_url, lambda: summarize_user_url(user_url), failed=lambda result: result[0] != 200)
+        if status_code == 200:
             return jsonify({"analysis": summarized_insights})
+        return jsonify({"error": f"Unable to access the URL. HTTP Status Code: {status_code}"}), 400
     except requests.RequestException:
         return jsonify({"error": "We can't reach this URL, please try again"}), 400
 
 @main.route('/match/test_photo_url', methods=['POST'])
 @jwt_required
+@admission.limited("test_photo_url")
 def test_photo_url():
     '''
-    Test the user provided URL by sending a GET request to it 
+    Test the user provided URL by sending a HEAD (or one-byte GET) request to it 
     if the response is 200 (meaning we can access the photo) return a success message to the user.
     '''
     user_url = request.json.get('url')
-    logger = current_app.logger
-    logger.info(f"Testing user URL: {user_url}")
+    logger.info("Testing user URL: %s", user_url)
     try:
-        response = requests.get(user_url)
-        if response.status_code == 200:
+        status_code = photo_probe_cache.get_or_load(
+            user_url, lambda: fetch_client.probe(user_url), failed=lambda code: code != 200)
+        if status_code == 200:
             return jsonify({"success": "We are able to reach your photo"}), 200
         else:
-            return jsonify({"error": f"Unable to access the URL. HTTP Status Code: {response.status_code}"}), 400
+            return jsonify({"error": f"Unable to access the URL. HTTP Status Code: {status_code}"}), 400
     except requests.RequestException:
         return jsonify({"error": "We can't reach this URL, please try again"}), 400
 
 @main.route('/match/match_penpal', methods=['POST'])
 @jwt_required
 def match_penpal_post():
-    logger = current_app.logger
     user = g.current_user  # Access the user from the request context
-    logger.info(f"Matching penpal for user: {user}")
+    logger.info("Matching penpal for user: %s", user)
 
     metadata = {"usr.id": user["id"]}
     event_name = "activity.request_match"
     track_custom_event(tracer, event_name, metadata)
 
     # Get the optional URLs
-    print("Checking for profile and photo URLs")
+    logger.debug("Checking for profile and photo URLs")
     profile_url = request.json.get('profileUrl')  
     photo_url = request.json.get('photoUrl')
 
     user_details = {}
     user_details["usr.id"] = user["id"]
+    stages = []
 
-    # Process profile URL if provided
+    # Process profile URL if provided, finishing after the response if needed
     if profile_url:
-        print(f"Analyzing external data from URL: {profile_url}")
+        logger.info("Analyzing external data from URL: %s", profile_url)
         user_details["external_profile_url"] = profile_url
-        analyze_external_data(profile_url)
+        stages.append(Stage("analyze_external_data", analyze_external_data, (profile_url,), critical=False))
 
-    # Process photo URL if provided
+    # Process photo URL if provided, finishing after the response if needed
     if photo_url:
-        print(f"Uploading photo from URL: {photo_url}") 
+        logger.info("Uploading photo from URL: %s", photo_url)
         user_details["external_photo_url"] = photo_url
-        upload_photo(photo_url)
+        stages.append(Stage("upload_photo", upload_photo, (photo_url,), critical=False))
 
     # Get other form data
     hobbies = request.json.get('hobbies')
@@ -295,15 +432,19 @@ def match_penpal_post():
     user_details["favorite_color"] = favorite_color
     user_details["favorite_quote"] = favorite_quote
 
-    # Save user details to DynamoDB
-    save_user_details(user_details)
+    # Save user details to DynamoDB and claim a penpal in one transaction
+    stages.append(Stage("make_penpal_match", make_penpal_match, (user["id"], user_details)))
 
-    # Match a penpal
-    matched_penpal = make_penpal_match(user["id"])
+    try:
+        results = stage_scheduler.run(current_app._get_current_object(), stages)
+    except StageTimeout as e:
+        logger.error("Matching timed out: %s", e)
+        if e.running:
+            # The claim may still commit, so a retry could match the user twice
+            return jsonify({"error": "Matching is taking too long, check your matches shortly"}), 504
+        return jsonify({"error": "Matching is taking too long, please try again"}), 504
+    matched_penpal = results["make_penpal_match"]
 
-    logger.info(f"Returning penpal {matched_penpal} for user {user}")
+    logger.info("Returning penpal %s for user %s", matched_penpal, user)
 
     return jsonify(matched_penpal)
-
-if __name__ == '__main__':
-    main.run(host="0.0.0.0", port=3333)
\ No newline at end of file
@@ -0,0 +1,143 @@
+import re
+import threading
+import zlib
+
+import numpy as np
+
+HOBBY_DIM = 64
+COLOR_DIM = 16
+QUOTE_DIM = 48
+FEATURE_DIM = HOBBY_DIM + COLOR_DIM + QUOTE_DIM
+
+# Relative weight of each feature block in the compatibility score
+HOBBY_WEIGHT = 0.6
+COLOR_WEIGHT = 0.2
+QUOTE_WEIGHT = 0.2
+
+WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def _bucket(token, dim):
+    # crc32 is stable across processes, unlike hash()
+    return zlib.crc32(token.encode()) % dim
+
+
+def _hobby_tokens(hobbies):
+    if isinstance(hobbies, str):
+        hobbies = hobbies.split(',')
+    return [hobby.strip().lower() for hobby in hobbies or () if hobby and hobby.strip()]
+
+
+def _fill_block(vector, offset, dim, tokens, weight):
+    if not tokens:
+        return
+    block = vector[offset:offset + dim]
+    for token in tokens:
+        block[_bucket(token, dim)] += 1.0
+    block *= weight / np.linalg.norm(block)
+
+
+def encode_profile(profile: dict) -> np.ndarray:
+    """Encode hobbies, favorite color and quote into one feature vector."""
+    vector = np.zeros(FEATURE_DIM, dtype=np.float32)
+    _fill_block(vector, 0, HOBBY_DIM, _hobby_tokens(profile.get('hobbies')), HOBBY_WEIGHT)
+    color = (profile.get('favorite_color') or '').strip().lower()
+    _fill_block(vector, HOBBY_DIM, COLOR_DIM, [color] if color else [], COLOR_WEIGHT)
+    quote_words = WORD_RE.findall((profile.get('favorite_quote') or '').lower())
+    _fill_block(vector, HOBBY_DIM + COLOR_DIM, QUOTE_DIM, quote_words, QUOTE_WEIGHT)
+    return vector
+
+
+def _fingerprint(profile):
+    return (str(profile.get('hobbies')), profile.get('favorite_color'), profile.get('favorite_quote'))
+
+
+class MatchEngine:
+    """Compatibility scoring over a NumPy feature matrix of penpals.
+
+    Each penpal occupies one row of the matrix. Rows are added, replaced
+    and freed incrementally as penpals change, and a request is scored
+    against every active row with a single matrix-vector product.
+    """
+
+    def __init__(self, capacity=1024):
+        self._lock = threading.Lock()
+        self._matrix = np.zeros((capacity, FEATURE_DIM), dtype=np.float32)
+        self._active = np.zeros(capacity, dtype=bool)
+        self._ids = [None] * capacity
+        self._rows = {}
+        self._fingerprints = {}
+        self._free = []
+        self._size = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _grow(self):
+        capacity = len(self._ids) * 2
+        matrix = np.zeros((capacity, FEATURE_DIM), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        active = np.zeros(capacity, dtype=bool)
+        active[:self._size] = self._active[:self._size]
+        self._matrix, self._active = matrix, active
+        self._ids.extend([None] * (capacity - len(self._ids)))
+
+    def _upsert(self, penpal_id, profile):
+        fingerprint = _fingerprint(profile)
+        row = self._rows.get(penpal_id)
+        if row is not None and self._fingerprints[penpal_id] == fingerprint:
+            return
+        vector = encode_profile(profile)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                if self._size == len(self._ids):
+                    self._grow()
+                row = self._size
+                self._size += 1
+            self._rows[penpal_id] = row
+            self._ids[row] = penpal_id
+            self._active[row] = True
+        self._matrix[row] = vector
+        self._fingerprints[penpal_id] = fingerprint
+
+    def _remove(self, penpal_id):
+        row = self._rows.pop(penpal_id, None)
+        if row is None:
+            return
+        del self._fingerprints[penpal_id]
+        self._active[row] = False
+        self._matrix[row] = 0
+        self._ids[row] = None
+        self._free.append(row)
+
+    def upsert(self, penpal_id, profile):
+        """Add a penpal or re-encode it if its profile changed."""
+        with self._lock:
+            self._upsert(penpal_id, profile)
+
+    def remove(self, penpal_id):
+        with self._lock:
+            self._remove(penpal_id)
+
+    def sync(self, profiles: dict):
+        """Bring the matrix in line with {penpal_id: profile}, touching only changes."""
+        with self._lock:
+            for penpal_id in [penpal_id for penpal_id in self._rows if penpal_id not in profiles]:
+                self._remove(penpal_id)
+            for penpal_id, profile in profiles.items():
+                self._upsert(penpal_id, profile)
+
+    def top_k(self, profile: dict, k=5):
+        """Return up to k (penpal_id, score) pairs, best first."""
+        vector = encode_profile(profile)
+        with self._lock:
+            if not self._rows:
+                return []
+            scores = self._matrix[:self._size] @ vector
+            scores[~self._active[:self._size]] = -np.inf
+            k = min(k, len(self._rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self._ids[row], float(scores[row])) for row in top]
@@ -0,0 +1,167 @@
+import base64
+import binascii
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from boto3.dynamodb.types import TypeDeserializer
+
+from aws_clients import get_client
+
+logger = logging.getLogger(__name__)
+
+# GSI on MATCHES_TABLE with user_id as partition key and timestamp as sort key
+MATCHES_USER_INDEX = os.getenv('MATCHES_USER_INDEX', 'user_id-timestamp-index')
+MATCH_HISTORY_PAGE_SIZE = int(os.getenv('MATCH_HISTORY_PAGE_SIZE', '20'))
+MATCH_HISTORY_MAX_PAGE_SIZE = int(os.getenv('MATCH_HISTORY_MAX_PAGE_SIZE', '100'))
+# Most recent matches per user that the matcher will not repeat
+MATCH_HISTORY_RECENT = int(os.getenv('MATCH_HISTORY_RECENT', '50'))
+MATCH_HISTORY_CACHE_SIZE = int(os.getenv('MATCH_HISTORY_CACHE_SIZE', '10000'))
+MATCH_HISTORY_CACHE_TTL = float(os.getenv('MATCH_HISTORY_CACHE_TTL', '300'))
+
+# Attributes of a LastEvaluatedKey on the index: its keys plus the table's
+CURSOR_KEYS = {'user_id', 'timestamp', 'penpal_id', 'match_id'}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(last_key):
+    """Turn a LastEvaluatedKey into an opaque URL-safe token."""
+    if not last_key:
+        return None
+    data = json.dumps(last_key, separators=(',', ':'), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor, user_id):
+    """Turn a token back into an ExclusiveStartKey, refusing one for another user."""
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key = json.loads(data)
+    except (binascii.Error, ValueError):
+        raise InvalidCursor("Invalid cursor")
+    if (not isinstance(key, dict) or set(key) != CURSOR_KEYS
+            or not all(isinstance(value, dict) and len(value) == 1 and set(value) <= {'S', 'N'}
+                       and isinstance(next(iter(value.values())), str) for value in key.values())):
+        raise InvalidCursor("Invalid cursor")
+    if key['user_id'] != {'S': user_id}:
+        raise InvalidCursor("Invalid cursor")
+    return key
+
+
+class MatchHistory:
+    """A user's past matches, read from a user-keyed index on MATCHES_TABLE.
+
+    Keeps a bounded LRU of each active user's most recently matched penpal
+    ids, so the matcher can skip them with a set lookup. The index is only
+    eventually consistent, so matches made by this worker are added to the
+    cached set as they are saved.
+    """
+
+    def __init__(self, table_name=None, index_name=MATCHES_USER_INDEX, recent=MATCH_HISTORY_RECENT,
+                 maxsize=MATCH_HISTORY_CACHE_SIZE, ttl=MATCH_HISTORY_CACHE_TTL):
+        self.table_name = table_name
+        self.index_name = index_name
+        self.recent = recent
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._deserializer = TypeDeserializer()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._errors = 0
+
+    def _query(self, user_id, limit, start_key=None, **params):
+        if start_key:
+            params['ExclusiveStartKey'] = start_key
+        return get_client('dynamodb').query(
+            TableName=self.table_name or os.getenv('MATCHES_TABLE'),
+            IndexName=self.index_name,
+            KeyConditionExpression="user_id = :user_id",
+            ExpressionAttributeValues={':user_id': {'S': user_id}},
+            # Newest first
+            ScanIndexForward=False,
+            Limit=limit,
+            **params)
+
+    def page(self, user_id, limit=MATCH_HISTORY_PAGE_SIZE, cursor=None):
+        """Return (matches, next cursor) for one page of a user's history, newest first."""
+        start_key = decode_cursor(cursor, user_id) if cursor else None
+        limit = max(1, min(limit, MATCH_HISTORY_MAX_PAGE_SIZE))
+        response = self._query(user_id, limit, start_key)
+        matches = []
+        for item in response['Items']:
+            match = {key: self._deserializer.deserialize(value) for key, value in item.items()}
+            match['timestamp'] = int(match['timestamp'])
+            matches.append(match)
+        return matches, encode_cursor(response.get('LastEvaluatedKey'))
+
+    def _load_recent(self, user_id):
+        response = self._query(user_id, self.recent, ProjectionExpression="penpal_id")
+        return {item['penpal_id']['S'] for item in response['Items']}
+
+    def recent_penpals(self, user_id):
+        """Return the set of penpal ids recently matched with a user.
+
+        Fails open with an empty set, so matching still works when the
+        index cannot be read.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+        try:
+            penpal_ids = self._load_recent(user_id)
+        except Exception as e:
+            self._errors += 1
+            logger.warning("Failed to load match history for user %s: %s", user_id, e)
+            return frozenset()
+        with self._lock:
+            # Keep matches recorded since the cached set expired, which the index may not show yet
+            entry = self._entries.get(user_id)
+            if entry is not None and not entry[0]:
+                penpal_ids |= entry[1]
+            return self._store(user_id, now + self.ttl, penpal_ids)
+
+    def record(self, user_id, penpal_id):
+        """Remember a match this worker just saved."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > time.time():
+                self._store(user_id, entry[0], entry[1] | {penpal_id})
+            else:
+                # Not loaded or expired: hold recorded matches until the next load
+                recorded = entry[1] if entry is not None and not entry[0] else frozenset()
+                self._store(user_id, 0.0, recorded | {penpal_id})
+
+    def _store(self, user_id, expires_at, penpal_ids):
+        penpal_ids = frozenset(penpal_ids)
+        self._entries[user_id] = (expires_at, penpal_ids)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return penpal_ids
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'errors': self._errors,
+                'hit_rate': self._hits / lookups if lookups else None,
+            }
+
+
+match_history = MatchHistory()
@@ -0,0 +1,179 @@
+import gzip
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from flask import Response, current_app, render_template, request, session
+from werkzeug.http import parse_accept_header
+
+from metrics import timed
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_ENABLED = os.getenv('PAGE_CACHE_ENABLED', 'true').lower() == 'true'
+PAGE_CACHE_SIZE = int(os.getenv('PAGE_CACHE_SIZE', '2048'))
+# Smaller pages are served uncompressed
+PAGE_CACHE_MIN_COMPRESS = int(os.getenv('PAGE_CACHE_MIN_COMPRESS', '512'))
+# Brotli quality for pages rendered per context; pages without context use the maximum
+PAGE_CACHE_BROTLI_QUALITY = int(os.getenv('PAGE_CACHE_BROTLI_QUALITY', '5'))
+# Seconds browsers may reuse a shared page without revalidating it
+PAGE_CACHE_MAX_AGE = int(os.getenv('PAGE_CACHE_MAX_AGE', '0'))
+
+# Preferred first when the client accepts several equally
+ENCODINGS = ('br', 'gzip', 'identity')
+
+
+def _compress(encoding, body, brotli_quality):
+    if encoding == 'gzip':
+        # Level 9 costs little more than the default on pages this small
+        return gzip.compress(body, compresslevel=9, mtime=0)
+    return brotli.compress(body, quality=brotli_quality, mode=brotli.MODE_TEXT)
+
+
+class _Page:
+    """A rendered page as (body, headers) per content encoding, with a strong ETag each."""
+
+    __slots__ = ('representations',)
+
+    def __init__(self, body, cache_control, brotli_quality):
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.representations = {}
+        encodings = {'identity': body}
+        if len(body) >= PAGE_CACHE_MIN_COMPRESS:
+            for encoding in ('br', 'gzip') if brotli else ('gzip',):
+                compressed = _compress(encoding, body, brotli_quality)
+                if len(compressed) < len(body):
+                    encodings[encoding] = compressed
+        for encoding, data in encodings.items():
+            # Each encoding is a different representation, so it gets its own strong ETag
+            etag = f'"{digest}"' if encoding == 'identity' else f'"{digest}-{encoding}"'
+            headers = [('ETag', etag), ('Vary', 'Accept-Encoding'), ('Cache-Control', cache_control)]
+            if encoding != 'identity':
+                headers.append(('Content-Encoding', encoding))
+            self.representations[encoding] = (data, headers)
+
+    def select(self, accept_encoding):
+        """Pick the representation for an Accept-Encoding header."""
+        if not accept_encoding:
+            return self.representations['identity']
+        if ';' not in accept_encoding:
+            # No q-values, so every listed encoding is equally acceptable
+            listed = {token.strip().lower() for token in accept_encoding.split(',')}
+            encoding = next((encoding for encoding in ENCODINGS
+                             if encoding in self.representations and (encoding in listed or '*' in listed)), 'identity')
+        else:
+            encoding = parse_accept_header(accept_encoding).best_match(
+                [encoding for encoding in ENCODINGS if encoding in self.representations], default='identity')
+        return self.representations[encoding]
+
+
+class PageCache:
+    """Rendered templates cached as precompressed responses.
+
+    Pages are keyed by template and context, so shared pages are rendered
+    once and pages that vary by a few values (e.g. the user's name) are
+    kept in a bounded LRU. Each response carries a strong ETag, and a
+    request whose If-None-Match matches gets a 304. Requests with pending
+    flashed messages, and apps that reload templates, are rendered as before.
+    """
+
+    def __init__(self, maxsize=PAGE_CACHE_SIZE, enabled=PAGE_CACHE_ENABLED, max_age=PAGE_CACHE_MAX_AGE):
+        self.maxsize = maxsize
+        self.enabled = enabled
+        self.max_age = max_age
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._bypassed = 0
+        self._not_modified = 0
+
+    def _cache_control(self, private):
+        if private:
+            return 'private, no-cache'
+        return f'public, max-age={self.max_age}' if self.max_age else 'no-cache'
+
+    def _page(self, template, context, private=False):
+        # script_root is part of the key since url_for output depends on it
+        key = (template, request.script_root, private, tuple(sorted(context.items())))
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+                self._hits += 1
+                return page
+            self._misses += 1
+        with timed("render_template"):
+            # A page without context is compressed once per worker, so the slowest, smallest brotli pays off
+            page = _Page(render_template(template, **context).encode(), self._cache_control(private),
+                         PAGE_CACHE_BROTLI_QUALITY if context else 11)
+        with self._lock:
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.maxsize:
+                self._pages.popitem(last=False)
+        return page
+
+    @staticmethod
+    def _has_flashes():
+        # Touching session adds Vary: Cookie, which would keep shared caches
+        # from reusing the page, so only look when there is a session cookie
+        if current_app.config['SESSION_COOKIE_NAME'] not in request.cookies:
+            return False
+        return bool(session.get('_flashes'))
+
+    def render(self, template, private=False, **context):
+        """Return a response for a template, from the cache where possible.
+
+        Pass private=True for pages that carry user details.
+        """
+        if not self.enabled or current_app.jinja_env.auto_reload or self._has_flashes():
+            with self._lock:
+                self._bypassed += 1
+            with timed("render_template"):
+                return render_template(template, **context)
+
+        headers = request.headers
+        body, response_headers = self._page(template, context, private).select(headers.get('Accept-Encoding'))
+        if_none_match = headers.get('If-None-Match')
+        # Weak comparison, as If-None-Match requires: W/"x" matches "x"
+        if if_none_match and (response_headers[0][1] in if_none_match or if_none_match.strip() == '*'):
+            with self._lock:
+                self._not_modified += 1
+            return Response(status=304, headers=response_headers[:3])
+        return Response(body, mimetype='text/html', headers=response_headers)
+
+    def warm(self, app, templates):
+        """Render pages that take no context before the first request."""
+        if not self.enabled or app.jinja_env.auto_reload:
+            return
+        with app.test_request_context():
+            for template in templates:
+                try:
+                    self._page(template, {})
+                except Exception as e:
+                    logger.warning("Failed to pre-render %s: %s", template, e)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': self.enabled,
+                'brotli': brotli is not None,
+                'size': len(self._pages),
+                'hits': self._hits,
+                'misses': self._misses,
+                'bypassed': self._bypassed,
+                'not_modified': self._not_modified,
+                'hit_rate': self._hits / lookups if lookups else None,
+            }
+
+
+page_cache = PageCache()
@@ -0,0 +1,190 @@
+import logging
+import os
+import random
+import threading
+import time
+
+from boto3.dynamodb.conditions import Attr
+
+from aws_clients import get_table
+from match_engine import MatchEngine
+
+logger = logging.getLogger(__name__)
+
+POOL_REFRESH_SECONDS = int(os.getenv('PENPAL_POOL_REFRESH_SECONDS', '60'))
+MATCH_TOP_K = int(os.getenv('MATCH_TOP_K', '5'))
+# Random picks tried before scanning the pool for a penpal that is not excluded
+CHOOSE_ATTEMPTS = 8
+
+
+class PenpalPool:
+    """In-process pool of available penpals, refreshed in the background.
+
+    The pool does one full paginated Scan of PENPAL_TABLE and then keeps
+    itself fresh on a timer, so matching never reads DynamoDB on the request
+    path. Reads and writes are guarded by a lock and ids are kept in a list
+    with a position index, so picking, adding and removing are all O(1).
+    Profiles are also fed to a MatchEngine for compatibility scoring.
+    """
+
+    def __init__(self, table_name=None, refresh_seconds=POOL_REFRESH_SECONDS):
+        self.table_name = table_name
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._penpals = {}
+        self._ids = []
+        self._positions = {}
+        self.engine = MatchEngine()
+        self._pid = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._last_refresh = None
+        self._refresh_count = 0
+        self._refresh_errors = 0
+        self._hits = 0
+        self._misses = 0
+
+    def _table(self):
+        table_name = self.table_name or os.getenv('PENPAL_TABLE')
+        return get_table(table_name)
+
+    def _scan_available(self):
+        """Read every available penpal, following LastEvaluatedKey."""
+        table = self._table()
+        scan_kwargs = {'FilterExpression': Attr('available').eq(True)}
+        penpals = {}
+        while True:
+            response = table.scan(**scan_kwargs)
+            for item in response['Items']:
+                penpals[item['penpal_id']] = item
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                return penpals
+            scan_kwargs['ExclusiveStartKey'] = last_key
+
+    def refresh(self):
+        """Reload the pool from DynamoDB and swap it in atomically."""
+        try:
+            items = self._scan_available()
+        except Exception:
+            self._refresh_errors += 1
+            logger.exception("Failed to refresh penpal pool")
+            return False
+
+        penpals = {penpal_id: {'name': item['penpal_name']} for penpal_id, item in items.items()}
+        ids = list(penpals)
+        positions = {penpal_id: i for i, penpal_id in enumerate(ids)}
+        with self._lock:
+            self._penpals = penpals
+            self._ids = ids
+            self._positions = positions
+            self._last_refresh = time.time()
+            self._refresh_count += 1
+        self.engine.sync(items)
+        logger.info("Refreshed penpal pool with %d available penpals", len(ids))
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_seconds):
+            self.refresh()
+
+    def start(self):
+        """Load the pool and start the refresh thread for this process.
+
+        Safe to call repeatedly; a forked worker gets its own thread.
+        """
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+            self._stop = threading.Event()
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, name="penpal-pool-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def choose(self, exclude=frozenset()):
+        """Return a random available (penpal_id, penpal) pair not in exclude, or None."""
+        self.start()
+        with self._lock:
+            penpal_id = self._pick(exclude)
+            if penpal_id is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            return penpal_id, self._penpals[penpal_id]
+
+    def _pick(self, exclude):
+        if not self._ids:
+            return None
+        for _ in range(CHOOSE_ATTEMPTS):
+            penpal_id = random.choice(self._ids)
+            if penpal_id not in exclude:
+                return penpal_id
+        # Nearly every penpal is excluded: fall back to a pass over the pool
+        remaining = [penpal_id for penpal_id in self._ids if penpal_id not in exclude]
+        return random.choice(remaining) if remaining else None
+
+    def match(self, profile: dict, k=MATCH_TOP_K, exclude=frozenset()):
+        """Return the most compatible available (penpal_id, penpal) pair not in exclude, or None.
+
+        Falls back to a random pick when the profile carries no signal.
+        """
+        self.start()
+        # Ask for enough candidates that excluded penpals cannot crowd out the top k
+        candidates = [candidate for candidate in self.engine.top_k(profile, k + len(exclude))
+                      if candidate[0] not in exclude]
+        if not candidates or candidates[0][1] <= 0:
+            return self.choose(exclude)
+        with self._lock:
+            for penpal_id, _ in candidates[:k]:
+                if penpal_id in self._penpals:
+                    self._hits += 1
+                    return penpal_id, self._penpals[penpal_id]
+            self._misses += 1
+            return None
+
+    def upsert(self, penpal_id, item):
+        """Add or replace a penpal item, e.g. from a change notification."""
+        with self._lock:
+            if penpal_id not in self._positions:
+                self._positions[penpal_id] = len(self._ids)
+                self._ids.append(penpal_id)
+            self._penpals[penpal_id] = {'name': item['penpal_name']}
+        self.engine.upsert(penpal_id, item)
+
+    def remove(self, penpal_id):
+        """Drop a penpal that is no longer available."""
+        self.engine.remove(penpal_id)
+        with self._lock:
+            position = self._positions.pop(penpal_id, None)
+            if position is None:
+                return
+            last_id = self._ids.pop()
+            if last_id != penpal_id:
+                self._ids[position] = last_id
+                self._positions[last_id] = position
+            del self._penpals[penpal_id]
+
+    def stats(self):
+        """Hit rate and staleness, for tuning the refresh interval."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._ids),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else None,
+                'refresh_seconds': self.refresh_seconds,
+                'refresh_count': self._refresh_count,
+                'refresh_errors': self._refresh_errors,
+                'staleness_seconds': time.time() - self._last_refresh if self._last_refresh else None,
+            }
+
+
+penpal_pool = PenpalPool()
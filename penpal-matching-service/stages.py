@@ -0,0 +1,111 @@
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from ddtrace import tracer
+
+logger = logging.getLogger(__name__)
+
+MATCH_STAGE_WORKERS = int(os.getenv('MATCH_STAGE_WORKERS', '8'))
+MATCH_BACKGROUND_WORKERS = int(os.getenv('MATCH_BACKGROUND_WORKERS', '8'))
+MATCH_BACKGROUND_LIMIT = int(os.getenv('MATCH_BACKGROUND_LIMIT', '32'))
+MATCH_STAGE_DEADLINE = float(os.getenv('MATCH_STAGE_DEADLINE', '5'))
+# Extra time a critical stage that is already running gets past its deadline
+MATCH_STAGE_GRACE = float(os.getenv('MATCH_STAGE_GRACE', '5'))
+
+Stage = namedtuple('Stage', ['name', 'func', 'args', 'deadline', 'critical'], defaults=[(), MATCH_STAGE_DEADLINE, True])
+
+
+class StageTimeout(Exception):
+    """A critical stage missed its deadline.
+
+    running is False if it had not started and was cancelled, True if it
+    was still running past its grace period and may yet complete.
+    """
+
+    def __init__(self, stage_name, deadline, running=False):
+        if running:
+            message = f"Stage {stage_name} is still running past its {deadline}s deadline"
+        else:
+            message = f"Stage {stage_name} did not start within {deadline}s"
+        super().__init__(message)
+        self.stage_name = stage_name
+        self.deadline = deadline
+        self.running = running
+
+
+class StageScheduler:
+    """Run independent request stages concurrently on bounded thread pools.
+
+    Critical stages are awaited, each against its own deadline, and their
+    results are returned to the caller. Non-critical stages run detached on
+    their own pool, so slow background work never queues ahead of a critical
+    stage, and may finish after the response has been sent; if too many are
+    already pending they are dropped rather than queued without bound.
+
+    A critical stage that misses its deadline is cancelled if it has not
+    started. One that is already running may be about to commit work, so it
+    gets a grace period to finish before it is reported as still running.
+    A background stage that only starts after its deadline is skipped.
+    """
+
+    def __init__(self, max_workers=MATCH_STAGE_WORKERS, background_workers=MATCH_BACKGROUND_WORKERS,
+                 background_limit=MATCH_BACKGROUND_LIMIT, grace=MATCH_STAGE_GRACE):
+        self.grace = grace
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="match-stage")
+        self._background_executor = ThreadPoolExecutor(max_workers=background_workers,
+                                                       thread_name_prefix="match-background")
+        self._background_slots = threading.BoundedSemaphore(background_limit)
+
+    def _call(self, app, parent, stage, submitted_at):
+        if not stage.critical and time.monotonic() - submitted_at > stage.deadline:
+            logger.warning("Skipping background stage %s, queued past its %ss deadline", stage.name, stage.deadline)
+            return None
+        with app.app_context():
+            with tracer.start_span("match.stage", child_of=parent, resource=stage.name, activate=True) as span:
+                span.set_tag("stage.critical", stage.critical)
+                span.set_metric("stage.queue_ms", (time.monotonic() - submitted_at) * 1000)
+                return stage.func(*stage.args)
+
+    def _submit(self, executor, app, parent, stage):
+        return executor.submit(self._call, app, parent, stage, time.monotonic())
+
+    def _release_background(self, stage, future):
+        self._background_slots.release()
+        if future.exception() is not None:
+            logger.error("Background stage %s failed", stage.name, exc_info=future.exception())
+
+    def run(self, app, stages):
+        """Start all stages and return {name: result} for the critical ones."""
+        parent = tracer.current_span()
+        pending = []
+        for stage in stages:
+            if stage.critical:
+                pending.append((stage, time.monotonic(), self._submit(self._executor, app, parent, stage)))
+            elif self._background_slots.acquire(blocking=False):
+                future = self._submit(self._background_executor, app, parent, stage)
+                future.add_done_callback(lambda f, stage=stage: self._release_background(stage, f))
+            else:
+                logger.warning("Dropping background stage %s, too many pending", stage.name)
+
+        results = {}
+        for stage, started_at, future in pending:
+            remaining = stage.deadline - (time.monotonic() - started_at)
+            try:
+                results[stage.name] = future.result(timeout=max(remaining, 0))
+            except TimeoutError:
+                if future.cancel():
+                    raise StageTimeout(stage.name, stage.deadline) from None
+                logger.warning("Stage %s is past its %ss deadline but already running, waiting up to %ss more",
+                               stage.name, stage.deadline, self.grace)
+                try:
+                    results[stage.name] = future.result(timeout=self.grace)
+                except TimeoutError:
+                    raise StageTimeout(stage.name, stage.deadline, running=True) from None
+        return results
+
+
+stage_scheduler = StageScheduler()
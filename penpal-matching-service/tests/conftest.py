@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Fake credentials, so no test can reach a real AWS account; moto serves every call
+os.environ.update(AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing', AWS_SESSION_TOKEN='testing',
+                  AWS_DEFAULT_REGION='us-east-1', AWS_WARM_UP='false', APP_BACKGROUND_THREADS='false',
+                  DD_TRACE_ENABLED='false')
+os.environ.pop('AWS_ENDPOINT_URL', None)
+
+from ddtrace import tracer  # noqa: E402
+
+# ddtrace's pytest plugin may load the tracer before this file, so the variable alone can be too late
+tracer.enabled = False
+
+
+@pytest.fixture
+def aws():
+    """A moto-backed AWS with fresh shared clients."""
+    from moto import mock_aws
+
+    import aws_clients
+
+    with mock_aws():
+        aws_clients._state['pid'] = None
+        yield
+    aws_clients._state['pid'] = None
@@ -0,0 +1,95 @@
+import os
+import time
+
+import pytest
+from flask import Flask, g
+
+from admission import AdmissionController, SharedMemoryBackend, check_limit
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return SharedMemoryBackend(path=str(tmp_path / 'admission'), buckets=64, max_concurrent=2, lease_seconds=30)
+
+
+def test_take_spends_the_burst_then_refills(backend):
+    assert [backend.take('user', 50, 2)[0] for _ in range(3)] == [True, True, False]
+    allowed, retry_after = backend.take('user', 50, 2)
+    assert not allowed and 0 < retry_after <= 0.02
+    assert backend.take('other', 50, 2)[0]
+    time.sleep(0.03)
+    assert backend.take('user', 50, 2)[0]
+    assert backend.stats()['rejected_rate'] == 2
+
+
+def test_workers_share_the_file(backend, tmp_path):
+    other = SharedMemoryBackend(path=str(tmp_path / 'admission'), buckets=64, max_concurrent=2)
+    assert other.path == backend.path
+    assert backend.take('user', 1, 1)[0]
+    assert not other.take('user', 1, 1)[0]
+
+
+def test_enter_stops_at_max_concurrent(backend):
+    first, second = backend.enter(), backend.enter()
+    assert first and second
+    assert backend.enter() is None
+    assert backend.stats()['in_flight'] == 2
+    backend.leave(first)
+    assert backend.enter() is not None
+    stats = backend.stats()
+    assert stats['admitted'] == 3 and stats['rejected_concurrency'] == 1
+
+
+def test_expired_lease_is_reclaimed_and_its_leave_ignored(backend):
+    backend.lease_seconds = 0.01
+    stale = backend.enter()
+    time.sleep(0.02)
+    backend.lease_seconds = 30
+    fresh = backend.enter()
+    assert fresh[0] == stale[0]
+    backend.leave(stale)
+    assert backend.stats()['in_flight'] == 1
+    backend.leave(fresh)
+    assert backend.stats()['in_flight'] == 0
+
+
+def test_damaged_file_is_replaced(backend):
+    with open(backend.path, 'wb') as damaged:
+        damaged.write(b'garbage')
+    inode = os.stat(backend.path).st_ino
+    assert backend.take('user', 1, 1)[0]
+    assert os.stat(backend.path).st_size == backend.size
+    assert os.stat(backend.path).st_ino != inode
+
+
+@pytest.mark.parametrize('rate, burst', [(0, 5), (-1, 5), (1, 0.5), (float('nan'), 5)])
+def test_check_limit_rejects_limits_that_never_admit(rate, burst):
+    with pytest.raises(ValueError):
+        check_limit('endpoint', rate, burst)
+
+
+def test_controller_rejects_invalid_configured_limits(backend):
+    with pytest.raises(ValueError):
+        AdmissionController(backend, limits={'test_user_url': (0.0, 3.0)})
+
+
+def test_limited_returns_429_with_retry_after(backend):
+    app = Flask(__name__)
+    controller = AdmissionController(backend, limits={'fetch': (0.5, 1.0)})
+    calls = []
+
+    @controller.limited('fetch')
+    def fetch():
+        calls.append(1)
+        return 'ok'
+
+    with app.test_request_context():
+        g.current_user = {'id': 'u1'}
+        assert fetch() == 'ok'
+        response, status = fetch()
+        assert status == 429
+        assert response.headers['Retry-After'] == '2'
+        g.current_user = {'id': 'u2'}
+        assert fetch() == 'ok'
+    assert len(calls) == 2
+    assert backend.stats()['in_flight'] == 0
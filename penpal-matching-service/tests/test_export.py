@@ -0,0 +1,80 @@
+import base64
+import io
+import json
+from decimal import Decimal
+
+import boto3
+import pytest
+from boto3.dynamodb.types import Binary
+
+from export import CapacityThrottle, export, json_default, projection_params
+
+TABLE = 'matches'
+
+
+@pytest.fixture
+def table(aws):
+    dynamodb = boto3.resource('dynamodb')
+    table = dynamodb.create_table(TableName=TABLE, KeySchema=[{'AttributeName': 'match_id', 'KeyType': 'HASH'}],
+                                  AttributeDefinitions=[{'AttributeName': 'match_id', 'AttributeType': 'S'}],
+                                  BillingMode='PAY_PER_REQUEST')
+    with table.batch_writer() as batch:
+        for i in range(25):
+            batch.put_item(Item={'match_id': f"m{i:02}", 'name': f"Match {i}", 'score': Decimal(i) / 2,
+                                 'tags': {'b', 'a'}, 'photo': bytes([i, 0xff, 0x80])})
+    return table
+
+
+def read(output):
+    return sorted((json.loads(line) for line in output.getvalue().splitlines()), key=lambda r: r['match_id'])
+
+
+def test_json_default_types():
+    assert json_default(Decimal('3')) == 3 and isinstance(json_default(Decimal('3')), int)
+    assert json_default(Decimal('2.5')) == 2.5
+    assert json_default({'b', 'a'}) == ['a', 'b']
+    assert json_default(b'\xff\x00') == {'__bytes__': '/wA='}
+    assert json_default(Binary(b'\x80')) == {'__bytes__': 'gA=='}
+    assert json_default({Binary(b'b'), Binary(b'a')}) == [Binary(b'a'), Binary(b'b')]
+
+
+def test_projection_params_use_placeholders():
+    assert projection_params(None) == {}
+    assert projection_params(['match_id', 'name']) == {
+        'ProjectionExpression': "#p0, #p1", 'ExpressionAttributeNames': {'#p0': 'match_id', '#p1': 'name'}}
+
+
+def test_export_writes_every_item(table):
+    output = io.StringIO()
+    items, _ = export(TABLE, output, segments=2, page_size=4)
+    assert items == 25
+    records = read(output)
+    assert [record['match_id'] for record in records] == [f"m{i:02}" for i in range(25)]
+    assert records[3] == {'match_id': 'm03', 'name': "Match 3", 'score': 1.5, 'tags': ['a', 'b'],
+                          'photo': {'__bytes__': base64.b64encode(bytes([3, 0xff, 0x80])).decode()}}
+
+
+def test_export_binary_round_trips(table):
+    output = io.StringIO()
+    export(TABLE, output, segments=2)
+    for record in read(output):
+        index = int(record['match_id'][1:])
+        assert base64.b64decode(record['photo']['__bytes__']) == bytes([index, 0xff, 0x80])
+
+
+def test_export_projection(table):
+    output = io.StringIO()
+    export(TABLE, output, segments=3, projection=['match_id', 'name'])
+    assert all(set(record) == {'match_id', 'name'} for record in read(output))
+
+
+def test_failed_segment_is_raised(aws):
+    with pytest.raises(Exception, match='ResourceNotFound'):
+        export('missing-table', io.StringIO(), segments=2)
+
+
+def test_throttle_counts_consumed_capacity():
+    throttle = CapacityThrottle(0)
+    throttle.spend(1.5)
+    throttle.spend(2)
+    assert throttle.consumed == 3.5
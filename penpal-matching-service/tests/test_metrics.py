@@ -0,0 +1,72 @@
+import os
+import threading
+
+import pytest
+
+import metrics
+from metrics import BUCKETS, Histogram, render_prometheus, timed
+
+
+@pytest.fixture(autouse=True)
+def histograms(monkeypatch):
+    monkeypatch.setattr(metrics, '_histograms', {})
+
+
+def test_histogram_buckets_and_sum():
+    hist = Histogram(shards=2)
+    for seconds in (0.0005, 0.001, 0.02, 60):
+        hist.observe(seconds)
+    counts, total, count = hist.snapshot()
+    assert len(counts) == len(BUCKETS) + 1
+    assert counts[0] == 2 and counts[BUCKETS.index(0.025)] == 1 and counts[-1] == 1
+    assert count == 4
+    assert total == pytest.approx(60.0215)
+
+
+def test_histogram_memory_is_fixed_across_threads():
+    hist = Histogram(shards=4)
+    threads = [threading.Thread(target=lambda: [hist.observe(0.01) for _ in range(100)]) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(hist._shards) == 4
+    assert hist.snapshot()[2] == 1600
+
+
+def test_timed_as_block_and_decorator():
+    with timed('block'):
+        pass
+
+    @timed('call')
+    def fail():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        fail()
+    assert metrics.histogram('block').snapshot()[2] == 1
+    assert metrics.histogram('call').snapshot()[2] == 1
+
+
+def test_render_prometheus():
+    for seconds in (0.002, 0.003, 20):
+        metrics.observe('match', seconds)
+    text = render_prometheus('penpal', {'pool': {'size': 4, 'ready': True, 'name': 'skipped'}})
+    lines = text.splitlines()
+    assert lines[1] == '# TYPE penpal_stage_duration_seconds histogram'
+    assert 'penpal_stage_duration_seconds_bucket{stage="match",le="0.001"} 0' in lines
+    assert 'penpal_stage_duration_seconds_bucket{stage="match",le="0.005"} 2' in lines
+    assert 'penpal_stage_duration_seconds_bucket{stage="match",le="10.0"} 2' in lines
+    assert 'penpal_stage_duration_seconds_bucket{stage="match",le="+Inf"} 3' in lines
+    assert 'penpal_stage_duration_seconds_count{stage="match"} 3' in lines
+    assert lines[-2:] == ['penpal_pool_size 4', 'penpal_pool_ready 1']
+    assert text.endswith('\n')
+
+
+def test_copies_stay_identical():
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    other = os.path.join(here, '..', 'user-management-service', 'metrics.py')
+    if not os.path.exists(other):
+        pytest.skip("user-management-service is not checked out alongside")
+    with open(os.path.join(here, 'metrics.py')) as ours, open(other) as theirs:
+        assert ours.read() == theirs.read()
@@ -0,0 +1,58 @@
+import boto3
+import pytest
+
+from penpal_pool import PenpalPool
+
+TABLE = 'penpals'
+
+
+@pytest.fixture
+def pool(aws):
+    dynamodb = boto3.resource('dynamodb')
+    table = dynamodb.create_table(TableName=TABLE, KeySchema=[{'AttributeName': 'penpal_id', 'KeyType': 'HASH'}],
+                                  AttributeDefinitions=[{'AttributeName': 'penpal_id', 'AttributeType': 'S'}],
+                                  BillingMode='PAY_PER_REQUEST')
+    with table.batch_writer() as batch:
+        for i in range(6):
+            batch.put_item(Item={'penpal_id': f"p{i}", 'penpal_name': f"Penpal {i}", 'available': i < 4,
+                                 'hobbies': "chess, hiking" if i == 0 else "baking", 'favorite_color': "blue"})
+    pool = PenpalPool(table_name=TABLE, refresh_seconds=3600)
+    # Loads the pool; choose() and match() would otherwise start it on first use
+    pool.start()
+    yield pool
+    pool.stop()
+
+
+def test_refresh_loads_only_available_penpals(pool):
+    assert pool.stats()['size'] == 4
+    assert {pool.choose()[0] for _ in range(50)} <= {'p0', 'p1', 'p2', 'p3'}
+
+
+def test_choose_skips_excluded(pool):
+    for _ in range(20):
+        assert pool.choose(exclude={'p0', 'p1', 'p2'})[0] == 'p3'
+    assert pool.choose(exclude={'p0', 'p1', 'p2', 'p3'}) is None
+
+
+def test_remove_and_upsert(pool):
+    for penpal_id in ('p1', 'p3', 'p0'):
+        pool.remove(penpal_id)
+    pool.remove('missing')
+    assert pool.choose() == ('p2', {'name': "Penpal 2"})
+
+    pool.upsert('p9', {'penpal_id': 'p9', 'penpal_name': "Penpal 9", 'hobbies': "surfing"})
+    assert pool.choose(exclude={'p2'}) == ('p9', {'name': "Penpal 9"})
+    assert pool.stats()['size'] == 2
+
+
+def test_match_prefers_compatible_penpal(pool):
+    penpal_id, penpal = pool.match({'hobbies': "chess", 'favorite_color': "red"}, exclude={'p1'})
+    assert penpal_id == 'p0'
+    assert pool.match({'hobbies': "chess"}, exclude={'p0'})[0] != 'p0'
+
+
+def test_failed_refresh_keeps_the_pool(pool):
+    pool.table_name = 'missing-table'
+    assert not pool.refresh()
+    assert pool.stats()['size'] == 4
+    assert pool.stats()['refresh_errors'] == 1
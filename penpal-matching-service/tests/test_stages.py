@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+from stages import Stage, StageScheduler, StageTimeout
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+def test_runs_critical_stages_concurrently(app):
+    scheduler = StageScheduler(max_workers=2)
+    barrier = threading.Barrier(2, timeout=1)
+
+    def meet(value):
+        # Only returns if both stages run at once
+        barrier.wait()
+        return value
+
+    results = scheduler.run(app, [Stage("a", meet, (1,)), Stage("b", meet, (2,))])
+    assert results == {"a": 1, "b": 2}
+
+
+def test_background_stages_do_not_delay_the_result(app):
+    scheduler = StageScheduler()
+    release = threading.Event()
+    start = time.monotonic()
+    results = scheduler.run(app, [Stage("slow", release.wait, (1,), critical=False), Stage("fast", lambda: "ok")])
+    assert results == {"fast": "ok"}
+    assert time.monotonic() - start < 0.5
+    release.set()
+
+
+def test_queued_critical_stage_is_cancelled(app):
+    scheduler = StageScheduler(max_workers=1)
+    release = threading.Event()
+    blocker = scheduler._executor.submit(release.wait, 1)
+    ran = []
+    with pytest.raises(StageTimeout) as raised:
+        scheduler.run(app, [Stage("queued", ran.append, (1,), deadline=0.05)])
+    assert not raised.value.running
+    release.set()
+    blocker.result(1)
+    time.sleep(0.05)
+    assert ran == []
+
+
+def test_running_stage_gets_a_grace_period(app):
+    scheduler = StageScheduler(grace=1)
+    results = scheduler.run(app, [Stage("slow", lambda: time.sleep(0.15) or "done", deadline=0.05)])
+    assert results == {"slow": "done"}
+
+
+def test_running_stage_past_its_grace_is_reported_running(app):
+    scheduler = StageScheduler(grace=0.1)
+    release = threading.Event()
+    start = time.monotonic()
+    with pytest.raises(StageTimeout) as raised:
+        scheduler.run(app, [Stage("hung", release.wait, (2,), deadline=0.05)])
+    assert raised.value.running
+    assert time.monotonic() - start < 1
+    release.set()
+
+
+def test_late_background_stage_is_skipped(app):
+    scheduler = StageScheduler(background_workers=1)
+    release = threading.Event()
+    ran = []
+    scheduler.run(app, [Stage("busy", release.wait, (1,), critical=False),
+                        Stage("late", ran.append, (1,), deadline=0.05, critical=False)])
+    time.sleep(0.1)
+    release.set()
+    time.sleep(0.1)
+    assert ran == []
+
+
+def test_background_stages_beyond_the_limit_are_dropped(app):
+    scheduler = StageScheduler(background_workers=1, background_limit=1)
+    release = threading.Event()
+    ran = []
+    scheduler.run(app, [Stage("first", release.wait, (1,), critical=False),
+                        Stage("dropped", ran.append, (1,), critical=False)])
+    release.set()
+    time.sleep(0.1)
+    assert ran == []
@@ -0,0 +1,75 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '4096'))
+TOKEN_CACHE_TTL = float(os.getenv('TOKEN_CACHE_TTL', '300'))
+TOKEN_CACHE_ENABLED = os.getenv('TOKEN_CACHE_ENABLED', 'true').lower() == 'true'
+
+
+class TokenCache:
+    """Bounded cache of verified JWTs, keyed by a digest of the token.
+
+    Each entry holds the user payload prepared for g.current_user and
+    expires at the token's exp claim, or after ttl seconds when the token
+    has no exp, whichever comes first.
+    """
+
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL, enabled=TOKEN_CACHE_ENABLED):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        """Return the cached user for a token, or None."""
+        if not self.enabled:
+            return None
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self._misses += 1
+            return None
+
+    def put(self, token, payload, user):
+        """Remember a verified token until its exp or the configured TTL."""
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl
+        if payload.get("exp") is not None:
+            expires_at = min(expires_at, float(payload["exp"]))
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (expires_at, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': self.enabled,
+                'size': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else None,
+            }
+
+
+token_cache = TokenCache()
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit
+
+from requests.exceptions import InvalidURL
+
+URL_CACHE_SIZE = int(os.getenv('URL_CACHE_SIZE', '1024'))
+URL_CACHE_TTL = float(os.getenv('URL_CACHE_TTL', '300'))
+URL_CACHE_ERROR_TTL = float(os.getenv('URL_CACHE_ERROR_TTL', '30'))
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url: str) -> str:
+    """Normalize a URL so equivalent spellings share one cache entry.
+
+    Raises InvalidURL, a RequestException like the fetch itself would
+    raise, for a missing URL or one that cannot be parsed.
+    """
+    if not isinstance(url, str):
+        raise InvalidURL(f"Invalid URL {url!r}: expected a string")
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError as e:
+        raise InvalidURL(f"Invalid URL {url!r}: {e}") from e
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    netloc = host
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{host}:{port}"
+    if parts.username is not None:
+        # Credentials can change what a URL returns, so they stay in the key;
+        # the password only as a digest, since keys show up in logs and stats
+        userinfo = parts.username
+        if parts.password is not None:
+            userinfo += ':' + hashlib.sha256(parts.password.encode()).hexdigest()[:32]
+        netloc = f"{userinfo}@{netloc}"
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+class _Flight:
+    """An outbound load that concurrent callers for the same URL wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        # Cleared when the load finishes; still set if e.g. GreenletExit interrupted it
+        self.interrupted = True
+
+
+class UrlCache:
+    """Bounded LRU/TTL cache of per-URL results with single-flight loading.
+
+    Successful results live for ttl seconds and failures (raised exceptions,
+    or values the caller marks as failed) for error_ttl seconds. While a
+    URL is being loaded, other callers for it wait for that load instead of
+    starting their own.
+    """
+
+    def __init__(self, maxsize=URL_CACHE_SIZE, ttl=URL_CACHE_TTL, error_ttl=URL_CACHE_ERROR_TTL,
+                 should_cache_error=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.should_cache_error = should_cache_error or (lambda error: True)
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+
+    def _store(self, key, value, error, ttl):
+        self._entries[key] = (time.monotonic() + ttl, value, error)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get_or_load(self, url, loader, failed=None):
+        """Return the cached result for url, calling loader() on a miss."""
+        key = normalize_url(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._hits += 1
+                self._entries.move_to_end(key)
+                flight = None
+            else:
+                entry = None
+                flight = self._flights.get(key)
+                if flight is not None:
+                    self._coalesced += 1
+                else:
+                    self._misses += 1
+                    leader = self._flights[key] = _Flight()
+
+        if entry is not None:
+            _, value, error = entry
+        elif flight is not None:
+            flight.done.wait()
+            if flight.interrupted:
+                # The leader gave up without a result, so load it again
+                return self.get_or_load(url, loader, failed)
+            value, error = flight.value, flight.error
+        else:
+            value = error = None
+            try:
+                try:
+                    value = loader()
+                except Exception as e:
+                    error = e
+                with self._lock:
+                    if error is not None:
+                        if self.should_cache_error(error):
+                            self._store(key, None, error, self.error_ttl)
+                    elif failed is not None and failed(value):
+                        self._store(key, value, None, self.error_ttl)
+                    else:
+                        self._store(key, value, None, self.ttl)
+                leader.value, leader.error, leader.interrupted = value, error, False
+            finally:
+                # Always release waiters, even when a BaseException such as
+                # GreenletExit or a timeout interrupts the load
+                with self._lock:
+                    self._flights.pop(key, None)
+                leader.done.set()
+
+        if error is not None:
+            raise error
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses + self._coalesced
+            return {
+                'size': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'coalesced': self._coalesced,
+                'hit_rate': (self._hits + self._coalesced) / lookups if lookups else None,
+            }
@@ -0,0 +1,203 @@
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from metrics import timed
+
+USER_MANAGEMENT_URL = os.getenv('USER_MANAGEMENT_URL')
+USER_MANAGEMENT_CONNECT_TIMEOUT = float(os.getenv('USER_MANAGEMENT_CONNECT_TIMEOUT', '0.5'))
+USER_MANAGEMENT_READ_TIMEOUT = float(os.getenv('USER_MANAGEMENT_READ_TIMEOUT', '3'))
+USER_MANAGEMENT_RETRIES = int(os.getenv('USER_MANAGEMENT_RETRIES', '2'))
+USER_MANAGEMENT_BACKOFF = float(os.getenv('USER_MANAGEMENT_BACKOFF', '0.05'))
+USER_MANAGEMENT_POOL_SIZE = int(os.getenv('USER_MANAGEMENT_POOL_SIZE', '20'))
+# Consecutive failed calls that open the breaker, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('USER_MANAGEMENT_BREAKER_THRESHOLD', '5'))
+BREAKER_RESET_TIMEOUT = float(os.getenv('USER_MANAGEMENT_BREAKER_RESET', '30'))
+
+RETRY_STATUSES = (502, 503, 504)
+
+
+class UserManagementUnavailable(requests.RequestException):
+    """The user management service is unreachable or the breaker is open."""
+
+
+class CircuitBreaker:
+    """Fail fast after repeated failures, then let one trial call through.
+
+    Closed: calls pass. After failure_threshold consecutive failures the
+    breaker opens and rejects calls for reset_timeout seconds, after which
+    a single trial call is allowed; its outcome closes or re-opens it.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._rejected = 0
+        self._opened = 0
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._trial_in_flight and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._trial_in_flight = True
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release(self):
+        """End a call that says nothing about health, letting another trial through if it was one."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._opened += 1
+            self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            return 'half_open' if self._trial_in_flight else 'open'
+
+    def stats(self):
+        state = self.state
+        with self._lock:
+            return {
+                'state': state,
+                'open': state != 'closed',
+                'consecutive_failures': self._failures,
+                'opened': self._opened,
+                'rejected': self._rejected,
+            }
+
+
+def _request_not_sent(error):
+    """True when the connection failed before any of the request was sent."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class UserManagementClient:
+    """Keep-alive client for calls to the user management service.
+
+    Uses one pooled session per process with short connect and read
+    timeouts. Calls that never reached the service are retried with
+    jittered backoff; timeouts and 502/503/504 answers are retried only for
+    idempotent calls. A 503 with Retry-After is the service shedding load
+    and is returned as is. A circuit breaker fails calls fast while the
+    service is unhealthy.
+    """
+
+    def __init__(self, base_url=USER_MANAGEMENT_URL, retries=USER_MANAGEMENT_RETRIES,
+                 backoff=USER_MANAGEMENT_BACKOFF, breaker=None):
+        self.base_url = base_url
+        self.timeout = (USER_MANAGEMENT_CONNECT_TIMEOUT, USER_MANAGEMENT_READ_TIMEOUT)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._session = None
+        self._retried = 0
+
+    def _get_session(self):
+        # Pooled connections must not be shared across a fork
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=USER_MANAGEMENT_POOL_SIZE)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+                    self._pid = pid
+        return self._session
+
+    def _sleep_before_retry(self, attempt):
+        with self._lock:
+            self._retried += 1
+        # Full jitter so retries from many workers do not arrive together
+        time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    def _post(self, path, idempotent, **kwargs):
+        if not self.breaker.allow():
+            raise UserManagementUnavailable("User management service is unavailable")
+        recorded = False
+        try:
+            session = self._get_session()
+            url = f"{self.base_url}{path}"
+            for attempt in range(self.retries + 1):
+                last_attempt = attempt == self.retries
+                try:
+                    response = session.post(url, timeout=self.timeout, **kwargs)
+                except requests.RequestException as e:
+                    if not last_attempt and (idempotent or _request_not_sent(e)):
+                        self._sleep_before_retry(attempt)
+                        continue
+                    self.breaker.record_failure()
+                    recorded = True
+                    raise UserManagementUnavailable(f"User management call to {path} failed: {e}") from e
+                if response.status_code == 503 and 'Retry-After' in response.headers:
+                    # Deliberate load shedding by a healthy service: pass it on
+                    # rather than retrying early or counting it as a failure
+                    return response
+                if response.status_code in RETRY_STATUSES:
+                    if idempotent and not last_attempt:
+                        self._sleep_before_retry(attempt)
+                        continue
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                recorded = True
+                return response
+        finally:
+            # Any other outcome, including an unexpected error, must not leave a trial call pending
+            if not recorded:
+                self.breaker.release()
+
+    @timed("user_management_login")
+    def login(self, email, password):
+        # Only retried when it never reached the service: after a read timeout or
+        # a 502/503/504 the first attempt may still be hashing the password, and
+        # retrying would double the hashing load when the service is overloaded
+        return self._post("/login", idempotent=False, data={"email": email, "password": password})
+
+    @timed("user_management_signup")
+    def signup(self, email, name, password):
+        return self._post("/signup", idempotent=False, data={"email": email, "name": name, "password": password})
+
+    @timed("user_management_logout")
+    def logout(self, token):
+        return self._post("/logout", idempotent=True, headers={"Authorization": f"Bearer {token}"})
+
+    def stats(self):
+        with self._lock:
+            retried = self._retried
+        return {'retried': retried, 'breaker': self.breaker.stats()}
+
+
+user_management_client = UserManagementClient()
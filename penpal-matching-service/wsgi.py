@@ -0,0 +1,7 @@
+from app import create_app
+
+app = create_app()
+
+if __name__ == '__main__':
+    # Development server only; production runs gunicorn with gunicorn.conf.py
+    app.run(host="0.0.0.0", port=3333)
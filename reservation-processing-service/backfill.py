@@ -0,0 +1,219 @@
+"""Backfill or replay reservation events into the reservation table.
+
+Streams reservation events from JSONL or CSV files, either EventBridge
+envelopes or bare reservation details. Items are built with the same logic
+as the Lambda and written by parallel batch writers. Invalid events, and
+items whose write failed, go to a rejects file that can be fed back in as
+input. Progress is checkpointed so an interrupted run can resume; records
+after the last checkpoint may be written twice, which is harmless because
+each write replaces the item with the same key.
+
+    python backfill.py events.jsonl --rejects rejects.jsonl --checkpoint backfill.checkpoint
+    python backfill.py events.csv --endpoint-url http://localhost:8000 --table reservations
+"""
+import argparse
+import csv
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+import botocore.session
+from botocore.config import Config
+
+# Records per work unit handed to a writer; each unit is sent in BatchWriteItem calls of 25
+CHUNK_SIZE = 500
+
+
+def detect_format(path):
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def read_events(paths, fmt=None):
+    """Yield (offset, detail_data) for every record in the input files, in order.
+
+    Offsets count records across all files, so a checkpoint stays valid as
+    long as the same files are given in the same order.
+    """
+    offset = 0
+    for path in paths:
+        with open(path, newline='') as f:
+            if (fmt or detect_format(path)) == 'csv':
+                for row in csv.DictReader(f):
+                    # Empty cells are columns that do not apply to this penpal type
+                    yield offset, {key: value for key, value in row.items() if key and value != ''}
+                    offset += 1
+                continue
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = line.rstrip('\n')
+                yield offset, entry.get('detail', entry) if isinstance(entry, dict) else entry
+                offset += 1
+
+
+class Progress:
+    """Counts, the rejects file and the checkpoint, shared by the reader and writers.
+
+    Work units finish out of order, so the checkpoint only advances past a
+    unit once every unit before it has finished.
+    """
+
+    def __init__(self, start_offset, rejects_path, checkpoint_path):
+        self.started_at = time.monotonic()
+        self.watermark = start_offset
+        self.written = 0
+        self.rejected = 0
+        self.failed = 0
+        self.checkpoint_path = checkpoint_path
+        self._finished = {}
+        self._lock = threading.Lock()
+        self._rejects = open(rejects_path, 'a') if rejects_path else None
+
+    def reject(self, offset, detail_data, error, write_failed=False):
+        with self._lock:
+            if write_failed:
+                self.failed += 1
+            else:
+                self.rejected += 1
+            if self._rejects:
+                self._rejects.write(json.dumps({'offset': offset, 'error': error, 'detail': detail_data}) + '\n')
+
+    def finish(self, start, end, written):
+        with self._lock:
+            self.written += written
+            self._finished[start] = end
+            while self.watermark in self._finished:
+                self.watermark = self._finished.pop(self.watermark)
+
+    def save_checkpoint(self):
+        with self._lock:
+            if self._rejects:
+                self._rejects.flush()
+            if not self.checkpoint_path:
+                return
+            state = {'offset': self.watermark, 'written': self.written,
+                     'rejected': self.rejected, 'failed': self.failed}
+        temporary = f"{self.checkpoint_path}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(state, f)
+        os.replace(temporary, self.checkpoint_path)
+
+    def report(self, final=False):
+        elapsed = time.monotonic() - self.started_at
+        with self._lock:
+            line = (f"offset {self.watermark}  written {self.written}  rejected {self.rejected}  "
+                    f"failed {self.failed}  {self.written / elapsed if elapsed else 0:.0f} items/s")
+        print(f"{'done' if final else 'progress'}: {line}  elapsed {elapsed:.1f}s", file=sys.stderr)
+
+    def close(self):
+        if self._rejects:
+            self._rejects.close()
+
+
+def load_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return json.load(f)['offset']
+
+
+def writer(client, table, units, progress, serialize_item, keys):
+    # Imported here so only the batch path pays for boto3, as in the Lambda
+    from boto3.dynamodb.table import BatchWriter
+
+    while True:
+        unit = units.get()
+        if unit is None:
+            return
+        start, end, records = unit
+        try:
+            # BatchWriter resends unprocessed items until they are written, and
+            # keeps only the last of several records with the same key
+            with BatchWriter(table, client, overwrite_by_pkeys=keys) as batch:
+                for _, item in records:
+                    batch.put_item(Item=serialize_item(item))
+            written = len(records)
+        except Exception as e:
+            for offset, item in records:
+                progress.reject(offset, item, f"write failed: {str(e)}", write_failed=True)
+            written = 0
+        progress.finish(start, end, written)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+', help="JSONL or CSV files of reservation events")
+    parser.add_argument('--format', choices=('jsonl', 'csv'), help="input format (default: from file extension)")
+    parser.add_argument('--table', default=os.environ.get('PENPAL_RESERVATION_TABLE'),
+                        help="reservation table (default: $PENPAL_RESERVATION_TABLE)")
+    parser.add_argument('--endpoint-url', help="DynamoDB endpoint, e.g. a local stand-in")
+    parser.add_argument('--region', help="AWS region (default: from the environment)")
+    parser.add_argument('--workers', type=int, default=8, help="parallel batch writers")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="records per work unit")
+    parser.add_argument('--rejects', help="append rejected events to this JSONL file")
+    parser.add_argument('--checkpoint', help="checkpoint file to resume from and update")
+    parser.add_argument('--restart', action='store_true', help="ignore an existing checkpoint")
+    parser.add_argument('--report-every', type=float, default=5, help="seconds between progress reports")
+    args = parser.parse_args()
+    if not args.table:
+        parser.error("--table or PENPAL_RESERVATION_TABLE is required")
+
+    # The Lambda module creates its own client on import, which needs a region
+    if args.region:
+        os.environ.setdefault('AWS_DEFAULT_REGION', args.region)
+    from reservation_processing import RESERVATION_KEYS, InvalidReservation, parse_reservation, serialize_item
+
+    client = botocore.session.get_session().create_client(
+        'dynamodb', region_name=args.region, endpoint_url=args.endpoint_url,
+        config=Config(max_pool_connections=args.workers, retries={'max_attempts': 10, 'mode': 'adaptive'}))
+
+    start_offset = 0 if args.restart else load_checkpoint(args.checkpoint)
+    if start_offset:
+        print(f"resuming from offset {start_offset}", file=sys.stderr)
+    progress = Progress(start_offset, args.rejects, args.checkpoint)
+    units = queue.Queue(maxsize=args.workers * 2)
+    threads = [threading.Thread(target=writer, daemon=True,
+                                args=(client, args.table, units, progress, serialize_item, RESERVATION_KEYS))
+               for _ in range(args.workers)]
+    for thread in threads:
+        thread.start()
+
+    next_report = time.monotonic() + args.report_every
+    unit_start, next_offset, records = start_offset, start_offset, []
+    try:
+        for offset, detail_data in read_events(args.inputs, args.format):
+            if offset < start_offset:
+                continue
+            try:
+                records.append((offset, parse_reservation(detail_data)))
+            except InvalidReservation as e:
+                progress.reject(offset, detail_data, str(e))
+            next_offset = offset + 1
+            if next_offset - unit_start >= args.chunk_size:
+                units.put((unit_start, next_offset, records))
+                unit_start, records = next_offset, []
+            if time.monotonic() >= next_report:
+                progress.save_checkpoint()
+                progress.report()
+                next_report = time.monotonic() + args.report_every
+        if next_offset > unit_start:
+            units.put((unit_start, next_offset, records))
+    finally:
+        for _ in threads:
+            units.put(None)
+        for thread in threads:
+            thread.join()
+        progress.save_checkpoint()
+        progress.report(final=True)
+        progress.close()
+    return 1 if progress.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
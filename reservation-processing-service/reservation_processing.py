@@ -1,11 +1,181 @@
-import boto3
+import botocore.session
 import json
+import math
 import os
+import time
 
-dynamodb = boto3.resource('dynamodb')
-reservation_table = dynamodb.Table(os.environ.get('PENPAL_RESERVATION_TABLE'))
+RESERVATION_TABLE = os.environ.get('PENPAL_RESERVATION_TABLE')
+
+# A low-level client is enough for PutItem and avoids importing boto3 and
+# loading the DynamoDB resource model on every cold start
+dynamodb_client = botocore.session.get_session().create_client('dynamodb')
+
+# DynamoDB accepts at most 25 items per BatchWriteItem call
+BATCH_CHUNK_SIZE = 25
+# BatchWriteItem calls per chunk while DynamoDB leaves items unprocessed
+BATCH_WRITE_ATTEMPTS = int(os.environ.get('BATCH_WRITE_ATTEMPTS', '5'))
+# A BatchWriteItem call with two items of the same key is rejected as a whole,
+# so only the last put for each key is written
+RESERVATION_KEYS = ['customer_id']
+
+def build_reservation_item(detail_data):
+    """Build the DynamoDB item for a reservation, raising KeyError if fields are missing."""
+    item={
+        'customer_id': detail_data['customer_id'],
+        'penpal_email': detail_data['penpal_email'],
+        'penpal_type': detail_data['penpal_type'],
+    }
+
+    # Add conditional attributes based on penpal type
+    if detail_data['penpal_type'] == 'Unicorn':
+        item['unicorn_type'] = detail_data['unicorn_type']
+        item['unicorn_secret_id'] = detail_data['unicorn_secret_id']
+    elif detail_data['penpal_type'] == 'Puppy':
+        item['puppy_type'] = detail_data['puppy_type']
+        item['puppy_secret_id'] = detail_data['puppy_secret_id']
+
+    return item
+
+class InvalidReservation(ValueError):
+    """A reservation event is missing required fields or is malformed."""
+
+def parse_reservation(detail_data):
+    """Validate a reservation and build its item, raising InvalidReservation if it cannot be stored."""
+    try:
+        item = build_reservation_item(detail_data)
+    except KeyError as e:
+        raise InvalidReservation(f"missing field {str(e)}") from e
+    except (TypeError, AttributeError) as e:
+        raise InvalidReservation(f"malformed reservation: {str(e)}") from e
+
+    # An invalid key would fail the whole BatchWriteItem call it is part of
+    if not isinstance(item['customer_id'], str) or not item['customer_id']:
+        raise InvalidReservation("customer_id must be a non-empty string")
+    # So would a value DynamoDB cannot store, such as NaN
+    serialize_item(item)
+    return item
+
+def serialize_value(value):
+    """Convert a JSON value to a DynamoDB attribute value, keeping lists and objects as L and M."""
+    if value is None:
+        return {'NULL': True}
+    if isinstance(value, bool):
+        return {'BOOL': value}
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and not math.isfinite(value):
+            raise InvalidReservation(f"unsupported number {value}")
+        return {'N': str(value)}
+    if isinstance(value, str):
+        return {'S': value}
+    if isinstance(value, (list, tuple)):
+        return {'L': [serialize_value(element) for element in value]}
+    if isinstance(value, dict):
+        return {'M': {str(key): serialize_value(element) for key, element in value.items()}}
+    raise InvalidReservation(f"unsupported value of type {type(value).__name__}")
+
+def serialize_item(item):
+    """Convert a reservation item to DynamoDB attribute values."""
+    return {key: serialize_value(value) for key, value in item.items()}
+
+def batch_records(event):
+    """Yield (item_identifier, detail_data) pairs from an SQS or EventBridge batch."""
+    if isinstance(event, list):
+        # Several EventBridge entries delivered together, e.g. by EventBridge Pipes
+        for index, entry in enumerate(event):
+            if not isinstance(entry, dict):
+                # Rejected by parse_reservation like any other malformed reservation
+                yield str(index), entry
+                continue
+            yield entry.get('id', str(index)), entry.get('detail', entry)
+        return
+
+    for record in event['Records']:
+        # SQS message body is either a raw reservation or an EventBridge envelope
+        try:
+            body = json.loads(record['body'])
+        except ValueError:
+            body = None
+        yield record['messageId'], body.get('detail', body) if isinstance(body, dict) else body
+
+def latest_per_customer(records):
+    """Keep the last of several (item_identifier, item) pairs with the same customer_id.
+
+    Returns (item_identifier, item, superseded identifiers) for each customer.
+    """
+    latest = {}
+    for item_identifier, item in records:
+        previous = latest.pop(item['customer_id'], None)
+        superseded = []
+        if previous is not None:
+            print(f"Reservation {previous[0]} superseded by {item_identifier} for the same customer")
+            superseded = previous[2] + [previous[0]]
+        latest[item['customer_id']] = (item_identifier, item, superseded)
+    return list(latest.values())
+
+def write_chunk(chunk):
+    """Write up to BATCH_CHUNK_SIZE (item_identifier, item) pairs, returning the identifiers not written.
+
+    Items DynamoDB leaves unprocessed are resent with backoff; only those
+    still unwritten when a call fails or attempts run out are returned.
+    """
+    pending = {item['customer_id']: item_identifier for item_identifier, item in chunk}
+    requests = [{'PutRequest': {'Item': serialize_item(item)}} for _, item in chunk]
+    for attempt in range(BATCH_WRITE_ATTEMPTS):
+        if attempt:
+            time.sleep(min(0.05 * 2 ** attempt, 1.0))
+        try:
+            response = dynamodb_client.batch_write_item(RequestItems={RESERVATION_TABLE: requests})
+        except Exception as e:
+            print(f"Error writing reservation batch: {str(e)}")
+            return list(pending.values())
+        requests = response.get('UnprocessedItems', {}).get(RESERVATION_TABLE, [])
+        unprocessed = {request['PutRequest']['Item']['customer_id']['S'] for request in requests}
+        pending = {customer_id: item_identifier for customer_id, item_identifier in pending.items()
+                   if customer_id in unprocessed}
+        if not pending:
+            return []
+    print(f"{len(pending)} reservations still unprocessed after {BATCH_WRITE_ATTEMPTS} attempts")
+    return list(pending.values())
+
+def write_batch(records):
+    """Write (item_identifier, item) pairs in BatchWriteItem chunks, returning identifiers that failed.
+
+    When records share a customer_id only the last is written; the earlier
+    ones are logged and reported with the same outcome, so they are retried
+    if it fails.
+    """
+    latest = latest_per_customer(records)
+    superseded = {item_identifier: earlier for item_identifier, _, earlier in latest}
+    failed = []
+    for start in range(0, len(latest), BATCH_CHUNK_SIZE):
+        chunk = [(item_identifier, item) for item_identifier, item, _ in latest[start:start + BATCH_CHUNK_SIZE]]
+        for item_identifier in write_chunk(chunk):
+            failed.extend(superseded[item_identifier] + [item_identifier])
+    return failed
+
+def batch_handler(event):
+    """Handle a batch of reservations and report partial failures."""
+    failed = []
+    records = []
+    total = 0
+    for item_identifier, detail_data in batch_records(event):
+        total += 1
+        try:
+            records.append((item_identifier, parse_reservation(detail_data)))
+        except InvalidReservation as e:
+            print(f"Rejecting reservation {item_identifier}: {str(e)}")
+            failed.append(item_identifier)
+
+    failed.extend(write_batch(records))
+    print(f"Processed reservation batch: {total} records, {len(failed)} failed")
+
+    return {'batchItemFailures': [{'itemIdentifier': item_identifier} for item_identifier in failed]}
 
 def lambda_handler(event, context):
+    # Batched reservations from SQS or several EventBridge entries
+    if isinstance(event, list) or 'Records' in event:
+        return batch_handler(event)
+
     # Extract the penpal reservation data from the event
     if 'detail' in event:
         # Event is coming from our brick and mortar retail stores
@@ -25,26 +195,14 @@ def lambda_handler(event, context):
     #   Don't forget to remove before prod - wouldn't want any leaky logging!
     print(f"received reservation data: {detail_data}")
 
-    #prepare data for dynamodb
-    item={
-        'customer_id': detail_data['customer_id'],
-        'penpal_email': detail_data['penpal_email'],
-        'penpal_type': detail_data['penpal_type'],
-    }
-
-    # Add conditional attributes based on penpal type
-    if detail_data['penpal_type'] == 'Unicorn':
-        item['unicorn_type'] = detail_data['unicorn_type']
-        item['unicorn_secret_id'] = detail_data['unicorn_secret_id']
-    elif detail_data['penpal_type'] == 'Puppy':
-        item['puppy_type'] = detail_data['puppy_type']
-        item['puppy_secret_id'] = detail_data['puppy_secret_id']
+    item = build_reservation_item(detail_data)
 
     # Store the penpal reservation data in dynamodb
     try:
         print("logging customer reservation")
-        response = reservation_table.put_item(
-          Item=item
+        response = dynamodb_client.put_item(
+          TableName=RESERVATION_TABLE,
+          Item=serialize_item(item)
         )
         
         ui_response = f"We have reserved a {detail_data['unicorn_type'] if detail_data['penpal_type'] == 'Unicorn' else detail_data['puppy_type']} penpal for you!  Write them today at {detail_data['penpal_email']}. Your new bestie can't wait to hear from you."
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Fake credentials, so no test can reach a real AWS account; moto serves every call
+os.environ.update(AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing', AWS_SESSION_TOKEN='testing',
+                  AWS_DEFAULT_REGION='us-east-1', PENPAL_RESERVATION_TABLE='reservations')
+os.environ.pop('AWS_ENDPOINT_URL', None)
+
+
+@pytest.fixture
+def table():
+    """The reservation table in a moto-backed DynamoDB."""
+    with mock_aws():
+        dynamodb = boto3.resource('dynamodb')
+        yield dynamodb.create_table(TableName='reservations',
+                                    KeySchema=[{'AttributeName': 'customer_id', 'KeyType': 'HASH'}],
+                                    AttributeDefinitions=[{'AttributeName': 'customer_id', 'AttributeType': 'S'}],
+                                    BillingMode='PAY_PER_REQUEST')
@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+import reservation_processing
+from reservation_processing import InvalidReservation, lambda_handler, parse_reservation
+
+
+def reservation(customer_id, **fields):
+    return {'customer_id': customer_id, 'penpal_email': f"{customer_id}@example.com", 'penpal_type': 'Puppy',
+            'puppy_type': 'corgi', 'puppy_secret_id': 'secret', **fields}
+
+
+def sqs_event(*details):
+    return {'Records': [{'messageId': f"m{i}", 'body': json.dumps(detail)} for i, detail in enumerate(details)]}
+
+
+def failures(response):
+    return sorted(failure['itemIdentifier'] for failure in response['batchItemFailures'])
+
+
+def test_api_event_writes_the_item(table):
+    response = lambda_handler({'body': json.dumps(reservation('c1'))}, None)
+    assert response['statusCode'] == 200
+    assert table.get_item(Key={'customer_id': 'c1'})['Item']['puppy_type'] == 'corgi'
+
+
+def test_sqs_batch_writes_every_chunk(table):
+    response = lambda_handler(sqs_event(*(reservation(f"c{i}") for i in range(60))), None)
+    assert failures(response) == []
+    assert table.scan(Select='COUNT')['Count'] == 60
+
+
+def test_eventbridge_envelopes_and_lists(table):
+    envelope = {'detail': reservation('c1')}
+    assert failures(lambda_handler(sqs_event(envelope), None)) == []
+    entries = [{'id': 'e1', 'detail': reservation('c2')}, 5, 'not a reservation']
+    assert failures(lambda_handler(entries, None)) == ['1', '2']
+    assert table.scan(Select='COUNT')['Count'] == 2
+
+
+def test_invalid_records_fail_alone(table):
+    event = sqs_event(reservation('c1'), {'customer_id': 'c2'}, [1, 2], reservation(''),
+                      reservation('c3', puppy_secret_id=float('nan')))
+    event['Records'].append({'messageId': 'm-not-json', 'body': '{'})
+    assert failures(lambda_handler(event, None)) == ['m-not-json', 'm1', 'm2', 'm3', 'm4']
+    assert table.scan(Select='COUNT')['Count'] == 1
+
+
+def test_nested_values_are_stored_as_lists_and_maps(table):
+    item = parse_reservation(reservation('c1', puppy_secret_id={'codes': [1, 2.5, None, True, "x"]}))
+    assert reservation_processing.serialize_item(item)['puppy_secret_id'] == {'M': {'codes': {'L': [
+        {'N': '1'}, {'N': '2.5'}, {'NULL': True}, {'BOOL': True}, {'S': 'x'}]}}}
+
+
+@pytest.mark.parametrize('value', [float('nan'), float('inf'), [float('-inf')]])
+def test_non_finite_numbers_are_rejected(value):
+    with pytest.raises(InvalidReservation):
+        parse_reservation(reservation('c1', puppy_secret_id=value))
+
+
+def test_duplicate_customers_keep_the_last_record(table):
+    event = sqs_event(reservation('c1', puppy_type='first'), reservation('c1', puppy_type='last'))
+    assert failures(lambda_handler(event, None)) == []
+    assert table.get_item(Key={'customer_id': 'c1'})['Item']['puppy_type'] == 'last'
+
+
+def test_only_records_of_a_failed_call_are_reported(table, monkeypatch):
+    client = reservation_processing.dynamodb_client
+    real = client.batch_write_item
+    calls = []
+
+    def second_call_fails(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 2:
+            raise RuntimeError("service unavailable")
+        return real(**kwargs)
+
+    monkeypatch.setattr(client, 'batch_write_item', second_call_fails)
+    details = [reservation(f"c{i}") for i in range(30)] + [reservation('c27', puppy_type='again')]
+    response = lambda_handler(sqs_event(*details), None)
+    # c25-c29 were in the failed second call; m27 was superseded by m30, which failed with it
+    assert failures(response) == ['m25', 'm26', 'm27', 'm28', 'm29', 'm30']
+    assert table.scan(Select='COUNT')['Count'] == 25
+
+
+def test_unprocessed_items_are_resent(table, monkeypatch):
+    client = reservation_processing.dynamodb_client
+    real = client.batch_write_item
+    calls = []
+
+    def first_call_leaves_one(RequestItems):
+        calls.append(RequestItems)
+        requests = RequestItems['reservations']
+        if len(calls) == 1:
+            real(RequestItems={'reservations': requests[1:]})
+            return {'UnprocessedItems': {'reservations': requests[:1]}}
+        return real(RequestItems=RequestItems)
+
+    monkeypatch.setattr(client, 'batch_write_item', first_call_leaves_one)
+    assert failures(lambda_handler(sqs_event(reservation('c1'), reservation('c2')), None)) == []
+    assert len(calls) == 2 and len(calls[1]['reservations']) == 1
+    assert table.scan(Select='COUNT')['Count'] == 2
+
+
+def test_items_still_unprocessed_are_reported(table, monkeypatch):
+    client = reservation_processing.dynamodb_client
+    monkeypatch.setattr(reservation_processing, 'BATCH_WRITE_ATTEMPTS', 2)
+    monkeypatch.setattr(client, 'batch_write_item', lambda RequestItems: {'UnprocessedItems': RequestItems})
+    assert failures(lambda_handler(sqs_event(reservation('c1'), reservation('c2')), None)) == ['m0', 'm1']
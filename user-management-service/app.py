@@ -1,6 +1,5 @@
 from flask import Flask
 import os
-import boto3
 
 def create_app():
     app = Flask(__name__)
@@ -8,6 +7,10 @@ def create_app():
     app.config['USER_TABLE'] = os.getenv('USER_TABLE')
     app.config['PENPAL_TABLE'] = os.getenv('PENPAL_TABLE')
 
+    # Shared, pre-warmed AWS clients for this worker
+    import aws_clients
+    aws_clients.init_app(app)
+
     # blueprint for auth routes
     from auth import auth as auth_blueprint
     app.register_blueprint(auth_blueprint)
@@ -1,15 +1,24 @@
-from flask import Blueprint, request, redirect, url_for, jsonify, current_app, flash
-from werkzeug.security import generate_password_hash, check_password_hash
-import boto3
+from flask import Blueprint, request, jsonify, current_app
 import jwt
-import os
 from ddtrace.appsec.trace_utils import track_user_login_success_event, track_user_login_failure_event, track_custom_event
 from ddtrace import tracer
+from botocore.exceptions import ClientError
+from aws_clients import get_table
+from metrics import timed
+from hashing import HASH_RETRY_AFTER, HashPoolBusy, hash_pool
+from user_cache import user_cache
 
 auth = Blueprint('auth', __name__)
 
 SECRET_KEY = "our-super-special-secret-key"  # Remember to move this to Secrets Manager
 
+@auth.errorhandler(HashPoolBusy)
+def hash_pool_busy(e):
+    """Shed load quickly when password hashing is saturated."""
+    response = jsonify({"error": "Service busy, please retry"})
+    response.headers["Retry-After"] = str(HASH_RETRY_AFTER)
+    return response, 503
+
 @auth.route('/users/login', methods=['POST'])
 def login_post():
     """Handle login form submission."""
@@ -17,20 +26,23 @@ def login_post():
     email = request.form.get('email')
     password = request.form.get('password')
 
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table(user_table)
+    table = get_table(user_table)
+
+    def load_user():
+        with timed("dynamodb_get_user"):
+            return table.get_item(Key={'user_id': email}).get('Item')
 
-    # Fetch user from DynamoDB
-    response = table.get_item(Key={'user_id': email})
+    # Fetch user from the cache, falling back to DynamoDB
+    user_data = user_cache.get_or_load(email, load_user)
 
-    if 'Item' not in response:
+    if user_data is None:
         track_user_login_failure_event(tracer, email, exists=False)
         return jsonify({"error": "invalid_email"}), 401
 
-    user_data = response['Item']
-
     # Validate password
-    if not check_password_hash(user_data['password'], password):
+    with timed("check_password_hash"):
+        password_valid = hash_pool.check_password_hash(user_data['password'], password)
+    if not password_valid:
         track_user_login_failure_event(tracer, email, exists=True)
         return jsonify({"error": "invalid_password"}), 401
 
@@ -39,7 +51,8 @@ def login_post():
         "sub": email,
         "name": user_data["name"]
     }
-    token = jwt.encode(payload, SECRET_KEY, algorithm="HS256")
+    with timed("jwt_encode"):
+        token = jwt.encode(payload, SECRET_KEY, algorithm="HS256")
 
     track_user_login_success_event(tracer, email)
 
@@ -58,23 +71,27 @@ def signup_post():
     if not email or not name or not password:
         return jsonify({"error": "All fields (email, name, password) are required"}), 400
 
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table(user_table)
-
-    # Check if email already exists
-    response = table.get_item(Key={'user_id': email})
-    if 'Item' in response:
-        return jsonify({"error": "Email already exists"}), 400
+    table = get_table(user_table)
 
     # Hash the password and create a new user
-    hashed_password = generate_password_hash(password)
+    with timed("generate_password_hash"):
+        hashed_password = hash_pool.generate_password_hash(password)
     new_user = {'user_id': email, 'name': name, 'password': hashed_password}
 
     # Log custom event for Datadog
     track_custom_event(tracer, "users.signup", {"usr.id": email})
 
-    # Add the new user to DynamoDB
-    table.put_item(Item=new_user)
+    # Add the new user to DynamoDB, unless the email is already taken
+    try:
+        with timed("dynamodb_put_user"):
+            table.put_item(Item=new_user, ConditionExpression='attribute_not_exists(user_id)')
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return jsonify({"error": "Email already exists"}), 400
+        raise
+    finally:
+        # Drop any cached "unknown email" entry either way
+        user_cache.invalidate(email)
 
     return jsonify({"message": "User created successfully"}), 201
 
@@ -0,0 +1,91 @@
+import logging
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_state = {'pid': None, 'session': None, 'resources': {}, 'clients': {}, 'tables': {}}
+
+
+def client_config():
+    """Build the botocore config shared by every client in this worker."""
+    return Config(
+        max_pool_connections=int(os.getenv('AWS_MAX_POOL_CONNECTIONS', '50')),
+        connect_timeout=float(os.getenv('AWS_CONNECT_TIMEOUT', '2')),
+        read_timeout=float(os.getenv('AWS_READ_TIMEOUT', '5')),
+        tcp_keepalive=os.getenv('AWS_TCP_KEEPALIVE', 'true').lower() == 'true',
+        retries={
+            'max_attempts': int(os.getenv('AWS_MAX_ATTEMPTS', '3')),
+            'mode': os.getenv('AWS_RETRY_MODE', 'standard'),
+        },
+    )
+
+
+def _current_state():
+    # boto3 connections must not be shared across a fork, so a new worker
+    # process starts with a fresh session.
+    pid = os.getpid()
+    if _state['pid'] != pid:
+        with _lock:
+            if _state['pid'] != pid:
+                _state.update(pid=pid, session=boto3.session.Session(),
+                              resources={}, clients={}, tables={})
+    return _state
+
+
+def get_resource(service: str):
+    """Return the shared boto3 resource for a service."""
+    state = _current_state()
+    resource = state['resources'].get(service)
+    if resource is None:
+        with _lock:
+            resource = state['resources'].get(service)
+            if resource is None:
+                resource = state['session'].resource(service, config=client_config())
+                state['resources'][service] = resource
+    return resource
+
+
+def get_client(service: str):
+    """Return the shared boto3 client for a service."""
+    state = _current_state()
+    client = state['clients'].get(service)
+    if client is None:
+        with _lock:
+            client = state['clients'].get(service)
+            if client is None:
+                client = state['session'].client(service, config=client_config())
+                state['clients'][service] = client
+    return client
+
+
+def get_table(table_name: str):
+    """Return a cached DynamoDB Table handle keyed by table name."""
+    state = _current_state()
+    table = state['tables'].get(table_name)
+    if table is None:
+        table = get_resource('dynamodb').Table(table_name)
+        state['tables'][table_name] = table
+    return table
+
+
+def warm_up(table_names):
+    """Open connections to DynamoDB before the worker takes traffic."""
+    for table_name in filter(None, table_names):
+        try:
+            get_table(table_name).meta.client.describe_table(TableName=table_name)
+        except (BotoCoreError, ClientError) as e:
+            # The connection is open even if we may not describe the table
+            logger.warning("Warm-up of table %s failed: %s", table_name, e)
+
+
+def init_app(app):
+    """Initialise the shared AWS client layer for a Flask app."""
+    _current_state()
+    if os.getenv('AWS_WARM_UP', 'true').lower() == 'true':
+        warm_up(app.config.get(name) for name in ('USER_TABLE', 'PENPAL_TABLE', 'MATCHES_TABLE'))
@@ -0,0 +1,33 @@
+import multiprocessing
+import os
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+
+if worker_class == 'gevent':
+    # Patch before the app is preloaded so every worker inherits patched I/O
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5050')}"
+workers = int(os.getenv('GUNICORN_WORKERS', str(multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+
+# Import the app and its dependencies once in the master; workers share them copy-on-write
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# Recycle workers gradually so they never all restart at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '200'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+# Keep idle connections from the load balancer open longer than its idle timeout
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '75'))
+
+accesslog = '-'
+
+
+def post_worker_init(worker):
+    """Open this worker's own AWS connections before it takes traffic."""
+    import aws_clients
+    aws_clients.warm_up(worker.wsgi.config.get(name) for name in ('USER_TABLE', 'PENPAL_TABLE'))
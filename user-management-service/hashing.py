@@ -0,0 +1,138 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+_CPUS = os.cpu_count() or 1
+# Every gunicorn worker has its own pool, so share the host's CPUs between them
+_WEB_WORKERS = int(os.getenv('GUNICORN_WORKERS', str(_CPUS * 2 + 1)))
+HASH_POOL_WORKERS = int(os.getenv('HASH_POOL_WORKERS', str(max(1, _CPUS // _WEB_WORKERS))))
+HASH_QUEUE_DEPTH = int(os.getenv('HASH_QUEUE_DEPTH', str(4 * HASH_POOL_WORKERS)))
+HASH_TIMEOUT = float(os.getenv('HASH_TIMEOUT', '10'))
+HASH_RETRY_AFTER = int(os.getenv('HASH_RETRY_AFTER', '1'))
+
+
+class HashPoolBusy(Exception):
+    """The password hashing queue is full, or a job could not finish in time."""
+
+
+def _timed(func, *args):
+    # Runs in the pool process; report when work started to measure queue wait
+    started_at = time.time()
+    return started_at, func(*args)
+
+
+class HashPool:
+    """Process pool for password hashing with a bounded admission queue.
+
+    Hashing runs outside the web worker so it neither holds the GIL nor
+    blocks other routes. At most workers + queue_depth jobs may be pending;
+    beyond that submit raises HashPoolBusy so the caller can fail fast. A job
+    holds its slot until it finishes, even after the caller gave up on it.
+    A pool broken by a lost child process is replaced.
+    """
+
+    def __init__(self, workers=HASH_POOL_WORKERS, queue_depth=HASH_QUEUE_DEPTH):
+        self.workers = workers
+        self.capacity = workers + queue_depth
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._rebuilt = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+
+    def _get_executor(self):
+        # A forked web worker must not reuse its parent's pool processes
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._executor = self._new_executor()
+                    self._slots = threading.BoundedSemaphore(self.capacity)
+                    self._in_flight = 0
+                    self._pid = pid
+        return self._executor
+
+    def _new_executor(self):
+        # spawn rather than fork, since the web worker is multi-threaded
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def _replace_broken(self, executor):
+        with self._lock:
+            # Another thread may already have replaced it
+            if self._executor is executor:
+                self._executor = self._new_executor()
+                self._rebuilt += 1
+        executor.shutdown(wait=False)
+
+    def _finished(self, future):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _run(self, func, *args):
+        executor = self._get_executor()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise HashPoolBusy("Password hashing queue is full")
+        submitted_at = time.time()
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = executor.submit(_timed, func, *args)
+        except BrokenProcessPool:
+            self._finished(None)
+            self._replace_broken(executor)
+            raise HashPoolBusy("Password hashing pool was restarted")
+        # The slot is freed when the job ends, not when this caller stops waiting
+        future.add_done_callback(self._finished)
+        try:
+            started_at, result = future.result(timeout=HASH_TIMEOUT)
+        except TimeoutError:
+            with self._lock:
+                self._timed_out += 1
+            raise HashPoolBusy("Password hashing timed out")
+        except BrokenProcessPool:
+            self._replace_broken(executor)
+            raise HashPoolBusy("Password hashing pool was restarted")
+        queue_wait = max(started_at - submitted_at, 0.0)
+        with self._lock:
+            self._completed += 1
+            self._queue_wait_total += queue_wait
+            self._queue_wait_max = max(self._queue_wait_max, queue_wait)
+        return result
+
+    def check_password_hash(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def generate_password_hash(self, password):
+        return self._run(generate_password_hash, password)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'capacity': self.capacity,
+                'in_flight': self._in_flight,
+                'utilization': min(self._in_flight, self.workers) / self.workers,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'timed_out': self._timed_out,
+                'rebuilt': self._rebuilt,
+                'queue_wait_avg_ms': self._queue_wait_total / self._completed * 1000 if self._completed else None,
+                'queue_wait_max_ms': self._queue_wait_max * 1000,
+            }
+
+
+hash_pool = HashPool()
@@ -1,7 +1,7 @@
-from flask import Flask, request, jsonify, render_template, Blueprint, current_app
-from ddtrace.contrib.trace_utils import set_user
-from ddtrace import tracer
-from boto3.dynamodb.conditions import Attr
+from flask import Response, jsonify, Blueprint
+from hashing import hash_pool
+from metrics import render_prometheus
+from user_cache import user_cache
 
 main = Blueprint('main', __name__)
 
@@ -9,5 +9,14 @@ main = Blueprint('main', __name__)
 def hello():
     return "Hello, World!"
 
-if __name__ == '__main__':
-    main.run(host="0.0.0.0", port=5050)
\ No newline at end of file
+@main.route('/users/stats', methods=['GET'])
+def stats():
+    """Expose password hashing pool and user cache statistics."""
+    return jsonify({"hash_pool": hash_pool.stats(), "user_cache": user_cache.stats()})
+
+@main.route('/users/metrics', methods=['GET'])
+def metrics():
+    """Expose stage timings, pool and cache statistics in Prometheus text format."""
+    gauges = {"hash_pool": hash_pool.stats(), "user_cache": user_cache.stats()}
+    return Response(render_prometheus("user_management", gauges),
+                    mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,129 @@
+# Kept identical in penpal-matching-service and user-management-service, like
+# aws_clients.py: each service is built from its own directory, so neither
+# image can import a module from the other. Change both copies together.
+import bisect
+import os
+import threading
+import time
+from functools import wraps
+
+from ddtrace import tracer
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Lock-protected shards per histogram; more only helps with many OS threads per worker
+METRICS_SHARDS = int(os.getenv('METRICS_SHARDS', '8'))
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, cheap enough for every request.
+
+    Records go to one of a fixed set of lock-protected shards, picked by the
+    OS thread id, so concurrent threads rarely share a lock. Memory stays
+    the same however many threads or greenlets record, since greenlets in
+    a gevent worker all run on one OS thread and share its shard.
+    """
+
+    def __init__(self, shards=METRICS_SHARDS):
+        # One count per bucket, the overflow bucket, then the running sum
+        self._shards = [[0] * (len(BUCKETS) + 1) + [0.0] for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+
+    def observe(self, seconds):
+        index = threading.get_native_id() % len(self._shards)
+        bucket = bisect.bisect_left(BUCKETS, seconds)
+        with self._locks[index]:
+            shard = self._shards[index]
+            shard[bucket] += 1
+            shard[-1] += seconds
+
+    def snapshot(self):
+        shards = []
+        for lock, shard in zip(self._locks, self._shards):
+            with lock:
+                shards.append(list(shard))
+        counts = [sum(column) for column in zip(*shards)]
+        return counts[:-1], counts[-1], sum(counts[:-1])
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def histogram(stage):
+    hist = _histograms.get(stage)
+    if hist is None:
+        with _histograms_lock:
+            hist = _histograms.setdefault(stage, Histogram())
+    return hist
+
+
+def observe(stage, seconds):
+    """Record a stage duration and attach it to the current trace."""
+    histogram(stage).observe(seconds)
+    if tracer.enabled:
+        span = tracer.current_root_span()
+        if span is not None:
+            span.set_metric(f"stage.{stage}.duration_ms", seconds * 1000)
+
+
+class timed:
+    """Time a block or function as a named stage.
+
+    Use as ``with timed("stage"):`` or as a ``@timed("stage")`` decorator.
+    """
+
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+    def __call__(self, func):
+        stage = self.stage
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(stage, time.perf_counter() - start)
+
+        return wrapper
+
+
+def _flatten(prefix, values, lines):
+    for key, value in values.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            _flatten(name, value, lines)
+        elif isinstance(value, bool):
+            lines.append(f"{name} {int(value)}")
+        elif isinstance(value, (int, float)):
+            lines.append(f"{name} {value}")
+
+
+def render_prometheus(namespace, gauges=None):
+    """Render stage histograms, plus any numeric stats as gauges, in Prometheus text format."""
+    name = f"{namespace}_stage_duration_seconds"
+    lines = [f"# HELP {name} Time spent in each request stage.", f"# TYPE {name} histogram"]
+    for stage in sorted(_histograms):
+        counts, total, count = _histograms[stage].snapshot()
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS, counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+        lines.append(f'{name}_sum{{stage="{stage}"}} {total}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+    if gauges:
+        _flatten(namespace, gauges, lines)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,78 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '30'))
+USER_CACHE_NEGATIVE_TTL = float(os.getenv('USER_CACHE_NEGATIVE_TTL', '5'))
+USER_CACHE_ENABLED = os.getenv('USER_CACHE_ENABLED', 'true').lower() == 'true'
+
+
+class UserCache:
+    """Bounded read-through cache of user records keyed by email.
+
+    Unknown emails are cached too, as negative entries with a shorter TTL,
+    so repeated failed logins do not each cost a DynamoDB read. Signup
+    invalidates the entry in this process; other workers see a new user
+    once their negative entry expires.
+    """
+
+    def __init__(self, maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL,
+                 negative_ttl=USER_CACHE_NEGATIVE_TTL, enabled=USER_CACHE_ENABLED):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._negative_hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def get_or_load(self, email, loader):
+        """Return the user record for email, or None, calling loader() on a miss."""
+        if not self.enabled:
+            return loader()
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(email)
+                if entry[1] is None:
+                    self._negative_hits += 1
+                else:
+                    self._hits += 1
+                return entry[1]
+            self._misses += 1
+
+        user = loader()
+        expires_at = time.monotonic() + (self.ttl if user is not None else self.negative_ttl)
+        with self._lock:
+            self._entries[email] = (expires_at, user)
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, email):
+        with self._lock:
+            if self._entries.pop(email, None) is not None:
+                self._invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            hits = self._hits + self._negative_hits
+            lookups = hits + self._misses
+            return {
+                'enabled': self.enabled,
+                'size': len(self._entries),
+                'hits': self._hits,
+                'negative_hits': self._negative_hits,
+                'misses': self._misses,
+                'invalidations': self._invalidations,
+                'hit_rate': hits / lookups if lookups else None,
+            }
+
+
+user_cache = UserCache()
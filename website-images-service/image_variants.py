@@ -0,0 +1,140 @@
+"""Generate resized WebP renditions of the website image assets.
+
+For every servable source image, writes a WebP rendition at each of
+WEB_VARIANT_WIDTHS (never wider than the source) under WEB_VARIANT_PREFIX.
+Variant keys include the source's ETag, so a rendition is generated once
+and only regenerated when the source changes; the Lambda only lists the
+variants and adds them to its manifest as a srcset. Sources are processed
+in a process pool. Runs as a separate job, since Pillow is not part of
+the Lambda package:
+
+    pip install -r requirements-variants.txt
+    WEB_ASSET_BUCKET=... python image_variants.py --workers 4 --prune
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import botocore.session
+from PIL import Image
+
+import website_images
+
+WEBP_QUALITY = int(os.getenv('WEB_VARIANT_QUALITY', '80'))
+# Variant keys change with the source, so browsers may cache them forever
+VARIANT_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_client = None
+
+
+def _s3():
+    # Each pool process makes its own client rather than sharing one across processes
+    global _client
+    if _client is None:
+        _client = botocore.session.get_session().create_client('s3')
+    return _client
+
+
+def render(source, widths, quality=WEBP_QUALITY):
+    """Return [(width, webp bytes)] for an image, skipping widths wider than the source."""
+    with Image.open(io.BytesIO(source)) as image:
+        image.load()
+        # Keep transparency when the source has it
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+        fitting = [width for width in widths if width <= image.width] or [image.width]
+        renditions = []
+        for width in fitting:
+            height = max(1, round(image.height * width / image.width))
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            buffer = io.BytesIO()
+            resized.save(buffer, format='WEBP', quality=quality, method=4)
+            renditions.append((width, buffer.getvalue()))
+        return renditions
+
+
+def generate(bucket, key, etag, widths):
+    """Render and upload one source's variants, returning (source bytes, {width: variant bytes})."""
+    s3 = _s3()
+    source = s3.get_object(Bucket=bucket, Key=key, IfMatch=etag)['Body'].read()
+    sizes = {}
+    for width, data in render(source, widths):
+        s3.put_object(
+            Bucket=bucket, Key=website_images.variant_key(key, etag, width), Body=data,
+            ContentType='image/webp', CacheControl=VARIANT_CACHE_CONTROL,
+            Metadata={'source-key': key, 'source-etag': etag.strip('"'), 'width': str(width)})
+        sizes[width] = len(data)
+    return len(source), sizes
+
+
+def pending_sources(sources, variants):
+    """Sources with no renditions yet for their current ETag."""
+    generated = {obj['Key'].rpartition('/')[0] + '/' for obj in variants}
+    return [obj for obj in sources if website_images.variant_dir(obj['Key'], obj['ETag']) not in generated]
+
+
+def stale_variants(sources, variants):
+    """Variant keys that belong to no current source ETag."""
+    current = {website_images.variant_dir(obj['Key'], obj['ETag']) for obj in sources}
+    return [obj['Key'] for obj in variants if obj['Key'].rpartition('/')[0] + '/' not in current]
+
+
+def run(widths=website_images.VARIANT_WIDTHS, workers=None, prune=False, force=False):
+    """Bring the variant prefix up to date, returning a summary dict."""
+    s3 = website_images.s3_client
+    bucket = website_images.BUCKET_NAME
+    sources = website_images.list_assets()
+    variants = website_images.list_objects(website_images.VARIANT_PREFIX)
+    todo = sources if force else pending_sources(sources, variants)
+
+    summary = {'sources': len(sources), 'generated': 0, 'skipped': len(sources) - len(todo), 'failed': 0,
+               'source_bytes': 0, 'variant_bytes': {}, 'seconds': 0.0, 'pruned': 0}
+    started_at = time.perf_counter()
+    if todo:
+        # spawn rather than fork, so pool processes never share the parent's connections
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = [pool.submit(generate, bucket, obj['Key'], obj['ETag'], widths) for obj in todo]
+            for future in futures:
+                try:
+                    source_bytes, sizes = future.result()
+                except Exception as e:
+                    print(f"Error generating variants: {str(e)}", file=sys.stderr)
+                    summary['failed'] += 1
+                    continue
+                summary['generated'] += 1
+                summary['source_bytes'] += source_bytes
+                for width, size in sizes.items():
+                    summary['variant_bytes'][width] = summary['variant_bytes'].get(width, 0) + size
+    summary['seconds'] = time.perf_counter() - started_at
+
+    if prune:
+        stale = stale_variants(sources, variants)
+        for start in range(0, len(stale), 1000):
+            s3.delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': key} for key in stale[start:start + 1000]]})
+        summary['pruned'] = len(stale)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--widths', help="comma-separated widths (default: WEB_VARIANT_WIDTHS)")
+    parser.add_argument('--workers', type=int, help="processes (default: CPU count)")
+    parser.add_argument('--prune', action='store_true', help="delete variants of replaced or removed sources")
+    parser.add_argument('--force', action='store_true', help="regenerate variants that are already current")
+    args = parser.parse_args()
+
+    widths = tuple(int(width) for width in args.widths.split(',')) if args.widths else website_images.VARIANT_WIDTHS
+    summary = run(widths, args.workers, args.prune, args.force)
+    print(f"{summary['generated']} generated, {summary['skipped']} up to date, {summary['failed']} failed, "
+          f"{summary['pruned']} pruned in {summary['seconds']:.1f}s", file=sys.stderr)
+    for width, size in sorted(summary['variant_bytes'].items()):
+        print(f"  {width}w: {size} bytes, {size / summary['source_bytes']:.1%} of the sources rendered",
+              file=sys.stderr)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,29 @@
+import importlib
+import os
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Fake credentials, so no test can reach a real AWS account; moto serves every call
+os.environ.update(AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing', AWS_SESSION_TOKEN='testing',
+                  AWS_DEFAULT_REGION='us-east-1', WEB_ASSET_BUCKET='assets-bucket')
+os.environ.pop('AWS_ENDPOINT_URL', None)
+
+
+@pytest.fixture
+def bucket():
+    """The asset bucket in a moto-backed S3."""
+    with mock_aws():
+        s3 = boto3.resource('s3')
+        yield s3.create_bucket(Bucket='assets-bucket')
+
+
+@pytest.fixture
+def website_images(bucket):
+    """A freshly imported handler module, as in a cold container."""
+    import website_images
+    return importlib.reload(website_images)
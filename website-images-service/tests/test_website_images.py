@@ -0,0 +1,89 @@
+import importlib
+import json
+
+import pytest
+
+
+def put(bucket, key, body=b'image'):
+    bucket.put_object(Key=key, Body=body)
+
+
+def get(website_images, **headers):
+    return website_images.lambda_handler({'headers': headers}, None)
+
+
+@pytest.mark.parametrize('if_none_match, matches', [
+    (None, False),
+    ('', False),
+    ('W/"abc-1"', True),
+    ('"abc-1"', True),
+    ('"other", W/"abc-1"', True),
+    ('*', True),
+    ('W/"abc-2"', False),
+])
+def test_etag_matches(website_images, if_none_match, matches):
+    assert website_images.etag_matches(if_none_match, 'W/"abc-1"') is matches
+
+
+def test_manifest_lists_sources_with_their_variants(bucket, website_images):
+    put(bucket, 'cat.png')
+    put(bucket, 'ENCRYPTED-dog.png')
+    put(bucket, 'notes.txt')
+    put(bucket, 'stray.png.webp')
+    etag = bucket.Object('cat.png').e_tag
+    for width in (640, 320):
+        put(bucket, website_images.variant_key('cat.png', etag, width))
+    put(bucket, website_images.variant_key('cat.png', '"stale"', 1280))
+
+    body = json.loads(get(website_images)['body'])
+    assert len(body['presignedUrls']) == 1
+    (image,) = body['images']
+    assert '/cat.png?' in image['src']
+    assert image['widths'] == [320, 640]
+    assert image['srcset'].count('w.webp') == 2
+
+
+def test_matching_if_none_match_gets_304(bucket, website_images):
+    put(bucket, 'cat.png')
+    response = get(website_images)
+    assert response['statusCode'] == 200
+    etag = response['headers']['ETag']
+    assert etag.startswith('W/"')
+
+    assert get(website_images, **{'If-None-Match': etag})['statusCode'] == 304
+    listed = f'"other", {etag.removeprefix("W/")}'
+    assert get(website_images, **{'if-none-match': listed})['statusCode'] == 304
+    assert get(website_images, **{'If-None-Match': '"other"'})['statusCode'] == 200
+
+
+def test_etag_survives_a_cold_start(bucket, website_images):
+    put(bucket, 'cat.png')
+    etag = get(website_images)['headers']['ETag']
+    cold = importlib.reload(website_images)
+    response = get(cold, **{'If-None-Match': etag})
+    assert response['statusCode'] == 304
+    assert response['headers']['ETag'] == etag
+
+
+def test_etag_changes_with_the_bucket(bucket, website_images, monkeypatch):
+    monkeypatch.setattr(website_images, 'LISTING_TTL', 0)
+    put(bucket, 'cat.png')
+    etag = get(website_images)['headers']['ETag']
+    put(bucket, 'cat.png', b'redrawn')
+    response = get(website_images, **{'If-None-Match': etag})
+    assert response['statusCode'] == 200
+    assert response['headers']['ETag'] != etag
+
+
+def test_cache_lifetime_ends_with_the_etag_window(bucket, website_images, monkeypatch):
+    monkeypatch.setattr(website_images, 'MANIFEST_REFRESH_MARGIN', 100)
+    monkeypatch.setattr(website_images.time, 'time', lambda: 1000.0 * 100 + 90)
+    put(bucket, 'cat.png')
+    assert get(website_images)['headers']['Cache-Control'] == 'public, max-age=10'
+
+
+def test_listing_errors_return_500(website_images, monkeypatch):
+    monkeypatch.setattr(website_images, 'BUCKET_NAME', 'missing-bucket')
+    response = get(website_images)
+    assert response['statusCode'] == 500
+    assert response['headers']['Cache-Control'] == 'no-store'
@@ -1,43 +1,178 @@
-import boto3
+import botocore.session
+import hashlib
 import os
 import json
+import time
 from botocore.exceptions import ClientError
 
 BUCKET_NAME = os.getenv('WEB_ASSET_BUCKET')
+ASSET_PREFIX = os.getenv('WEB_ASSET_PREFIX', '')
+# Resized renditions written by image_variants.py, keyed by the source's ETag
+VARIANT_PREFIX = os.getenv('WEB_VARIANT_PREFIX', 'variants/')
+VARIANT_WIDTHS = tuple(int(width) for width in os.getenv('WEB_VARIANT_WIDTHS', '320,640,1280').split(','))
 
-s3_client = boto3.client('s3')
+URL_EXPIRES_IN = 43200  # 12 hour expiration
+# Regenerate presigned URLs this long before they expire; also how long an ETag stays valid
+MANIFEST_REFRESH_MARGIN = max(1, int(os.getenv('MANIFEST_REFRESH_MARGIN', '3600')))
+# Re-list the bucket at most this often to notice changed assets
+LISTING_TTL = int(os.getenv('LISTING_TTL', '60'))
+# Upper bound on how long browsers and CloudFront may reuse a response
+CACHE_MAX_AGE = int(os.getenv('CACHE_MAX_AGE', '300'))
+
+# Presigning and listing only need botocore; skipping boto3 avoids importing s3transfer on cold start
+s3_client = botocore.session.get_session().create_client('s3')
+
+# Presigned URL manifest, kept across warm invocations
+_manifest = {'urls': [], 'body': None, 'signature': None, 'generated_at': 0, 'listed_at': 0}
+
+def is_servable(key):
+    return "ENCRYPTED" not in key and "ransom" not in key and "png" in key
+
+def list_objects(prefix):
+    """List every object under a prefix, following pagination."""
+    paginator = s3_client.get_paginator('list_objects_v2')
+    objects = []
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=prefix):
+        objects.extend(page.get('Contents', []))
+    return objects
+
+def is_variant(key):
+    # The default ASSET_PREFIX lists the whole bucket, variants included
+    return key.startswith(VARIANT_PREFIX) or key.endswith('.webp')
+
+def list_assets():
+    """List every servable source image under the asset prefix."""
+    return [obj for obj in list_objects(ASSET_PREFIX) if is_servable(obj['Key']) and not is_variant(obj['Key'])]
+
+def variant_dir(source_key, etag):
+    """Prefix holding a source image's renditions; a new source ETag gives a new prefix."""
+    stem = source_key.rsplit('.', 1)[0]
+    etag = etag.strip('"')
+    return f"{VARIANT_PREFIX}{stem}/{etag}/"
+
+def variant_key(source_key, etag, width):
+    return f"{variant_dir(source_key, etag)}{width}w.webp"
+
+def presign(key):
+    return s3_client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': BUCKET_NAME, 'Key': key},
+        ExpiresIn=URL_EXPIRES_IN
+    )
+
+def build_image_entries(objects, variants):
+    """Pair each source URL with a srcset of the renditions generated for its current ETag."""
+    renditions = {}
+    for obj in variants:
+        directory, _, name = obj['Key'].rpartition('/')
+        if name.endswith('w.webp') and name[:-6].isdigit():
+            renditions.setdefault(f"{directory}/", []).append((int(name[:-6]), obj['Key']))
+
+    images = []
+    for obj in objects:
+        available = sorted(renditions.get(variant_dir(obj['Key'], obj['ETag']), []))
+        images.append({
+            'src': presign(obj['Key']),
+            'srcset': ", ".join(f"{presign(key)} {width}w" for width, key in available),
+            'widths': [width for width, _ in available],
+        })
+    return images
+
+def listing_signature(objects):
+    """Digest of keys, ETags and LastModified times, to detect bucket changes."""
+    digest = hashlib.sha256()
+    for obj in sorted(objects, key=lambda o: o['Key']):
+        digest.update(f"{obj['Key']}|{obj.get('ETag')}|{obj.get('LastModified')}\n".encode())
+    return digest.hexdigest()
+
+def etag_window(now):
+    """Index of the MANIFEST_REFRESH_MARGIN-long window that now falls in.
+
+    Every manifest served during a window has URLs valid until at least its
+    end, so any copy fetched in the current window can be revalidated.
+    """
+    return int(now // MANIFEST_REFRESH_MARGIN)
+
+def manifest_etag(signature, now):
+    # Presigned URLs differ per container and signing time, so the ETag is
+    # weak and built from the listing instead of the body
+    return f'W/"{signature[:32]}-{etag_window(now)}"'
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of an If-None-Match list against an ETag."""
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix('W/')
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*' or tag.removeprefix('W/') == opaque:
+            return True
+    return False
+
+def get_manifest():
+    """Return the presigned URL manifest, regenerating it only when needed."""
+    now = time.time()
+    expiring = now >= _manifest['generated_at'] + URL_EXPIRES_IN - MANIFEST_REFRESH_MARGIN
+    if not expiring and now - _manifest['listed_at'] < LISTING_TTL:
+        return _manifest
+
+    objects = list_assets()
+    variants = list_objects(VARIANT_PREFIX)
+    signature = listing_signature(objects + variants)
+    if expiring or signature != _manifest['signature']:
+        images = build_image_entries(objects, variants)
+        urls = [image['src'] for image in images]
+        body = json.dumps({'presignedUrls': urls, 'images': images})
+        _manifest.update(
+            urls=urls,
+            body=body,
+            signature=signature,
+            generated_at=now,
+        )
+    _manifest['listed_at'] = now
+    return _manifest
+
+def request_header(event, name):
+    headers = event.get('headers') or {}
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
 
 def lambda_handler(event, context):
     print(f"got event {event}")
-    
-    try: 
-        # List objects in the bucket
-        response = s3_client.list_objects_v2(Bucket=BUCKET_NAME)
-        objects = response.get('Contents', [])
-        
-        # Generate presigned URLs
-        presigned_urls = []
-        for obj in objects:
-            if "ENCRYPTED" not in obj['Key'] and "ransom" not in obj['Key'] and "png" in obj['Key']:
-                presigned_url = s3_client.generate_presigned_url(
-                    'get_object',
-                    Params={'Bucket': BUCKET_NAME, 'Key': obj['Key']},
-                    ExpiresIn=43200  # 12 hour expiration
-                )
-                presigned_urls.append(presigned_url)
+
+    try:
+        manifest = get_manifest()
+        now = time.time()
+        etag = manifest_etag(manifest['signature'], now)
+
+        # Never let a cached response outlive the URLs inside it, nor its ETag's window
+        remaining = manifest['generated_at'] + URL_EXPIRES_IN - MANIFEST_REFRESH_MARGIN - now
+        window_left = (etag_window(now) + 1) * MANIFEST_REFRESH_MARGIN - now
+        max_age = max(0, min(CACHE_MAX_AGE, int(remaining), int(window_left)))
+        headers = {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*",
+            "Cache-Control": f"public, max-age={max_age}",
+            "ETag": etag
+        }
+
+        if etag_matches(request_header(event, 'if-none-match'), etag):
+            return {
+                'statusCode': 304,
+                'headers': headers,
+                'body': ''
+            }
 
         return {
             'statusCode': 200,
-            'headers': {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Cache-Control": "no-store"
-            },
-            'body': json.dumps({'presignedUrls': presigned_urls})
+            'headers': headers,
+            'body': manifest['body']
         }
     except ClientError as e:
         print(e)
-        
+
         return {
             'statusCode': 500,
             'headers': {